@@ -6,6 +6,7 @@ load_dotenv()
 # OpenAI
 ENABLE_OPENAI = os.getenv("ENABLE_OPENAI").lower() == "true"
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 
 # Azure OpenAI
 AZURE_OPENAI_ENDPOINT = os.getenv("AZURE_OPENAI_ENDPOINT")
@@ -32,6 +33,37 @@ CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", 0))
 SEPARATOR = os.getenv("SEPARATOR", "\n\n")
 PDF_INPUT_DIR = os.getenv("PDF_INPUT_DIR", '/app/data/pdf')
 CSV_OUTPUT_DIR = os.getenv("CSV_OUTPUT_DIR", '/app/data/csv')
+VECTORIZER_MANIFEST_PATH = os.getenv("VECTORIZER_MANIFEST_PATH", '/app/data/manifest/vectorizer_manifest.json')
+VECTORIZER_FULL_REBUILD = os.getenv("VECTORIZER_FULL_REBUILD", "false").lower() == "true"
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "50"))
+VECTOR_STORAGE_FORMAT = os.getenv("VECTOR_STORAGE_FORMAT", "csv").lower()
+VECTOR_STORAGE_DTYPE = os.getenv("VECTOR_STORAGE_DTYPE", "float32").lower()
+
+# Embedding設定
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "256"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_CONCURRENCY = int(os.getenv("EMBEDDING_CONCURRENCY", "4"))
+EMBEDDING_TPM_LIMIT = int(os.getenv("EMBEDDING_TPM_LIMIT", "1000000"))
+EMBEDDING_RPM_LIMIT = int(os.getenv("EMBEDDING_RPM_LIMIT", "3000"))
+EMBEDDING_MAX_RETRIES = int(os.getenv("EMBEDDING_MAX_RETRIES", "8"))
+EMBEDDING_BACKOFF_BASE = float(os.getenv("EMBEDDING_BACKOFF_BASE", "1.0"))
+EMBEDDING_BACKOFF_MAX = float(os.getenv("EMBEDDING_BACKOFF_MAX", "60.0"))
+ENABLE_EMBEDDING_CACHE = os.getenv("ENABLE_EMBEDDING_CACHE", "true").lower() == "true"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", '/app/data/cache/embeddings.sqlite')
+EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+# バックエンドの質問文Embedding (AsyncOpenAIで共有するHTTPコネクションプール)
+QUERY_EMBEDDING_MAX_CONNECTIONS = int(os.getenv("QUERY_EMBEDDING_MAX_CONNECTIONS", "20"))
+QUERY_EMBEDDING_MAX_KEEPALIVE = int(os.getenv("QUERY_EMBEDDING_MAX_KEEPALIVE", "10"))
+QUERY_EMBEDDING_KEEPALIVE_EXPIRY = float(os.getenv("QUERY_EMBEDDING_KEEPALIVE_EXPIRY", "60"))
+QUERY_EMBEDDING_TIMEOUT = float(os.getenv("QUERY_EMBEDDING_TIMEOUT", "30"))
+# 質問文Embeddingのプロセス内キャッシュ (LRU + TTL + バイト上限)
+ENABLE_QUERY_EMBEDDING_CACHE = os.getenv("ENABLE_QUERY_EMBEDDING_CACHE", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 ** 2)))
+# 複数ワーカー・再起動間で共有するSQLiteキャッシュ (空なら無効)
+QUERY_EMBEDDING_SHARED_CACHE_PATH = os.getenv("QUERY_EMBEDDING_SHARED_CACHE_PATH", "")
+QUERY_EMBEDDING_SHARED_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_SHARED_CACHE_MAX_BYTES", str(512 * 1024 ** 2)))
 
 # pgvector_db
 PGVECTOR_DB_NAME = os.getenv("PGVECTOR_DB_NAME")
@@ -39,6 +71,11 @@ PGVECTOR_DB_USER = os.getenv("PGVECTOR_DB_USER")
 PGVECTOR_DB_PASSWORD = os.getenv("PGVECTOR_DB_PASSWORD")
 PGVECTOR_DB_HOST = os.getenv("PGVECTOR_DB_HOST", "pgvector_db")
 PGVECTOR_DB_PORT = int(os.getenv("PGVECTOR_DB_PORT", 5432))
+# バックエンド検索用コネクションプール
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "2"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_MAX_IDLE = float(os.getenv("DB_POOL_MAX_IDLE", "600"))
 
 # インデックス設定
 INDEX_TYPE = os.getenv("INDEX_TYPE", "hnsw").lower()
@@ -47,10 +84,47 @@ HNSW_EF_CONSTRUCTION = int(os.getenv("HNSW_EF_CONSTRUCTION", "256"))
 HNSW_EF_SEARCH = int(os.getenv("HNSW_EF_SEARCH", "200"))
 IVFFLAT_LISTS = int(os.getenv("IVFFLAT_LISTS", "20"))
 IVFFLAT_PROBES = int(os.getenv("IVFFLAT_PROBES", "5"))
+# INDEX_TYPE=hnsw_bq: binary_quantizeしたHNSWで top_n × 係数 件を取得し、内積で再ランキング
+BQ_OVERSAMPLING_FACTOR = int(os.getenv("BQ_OVERSAMPLING_FACTOR", "4"))
+# immediate: インデックス作成後にINSERT / deferred: データ投入後にインデックス作成
+INDEX_BUILD_MODE = os.getenv("INDEX_BUILD_MODE", "immediate").lower()
+MAINTENANCE_WORK_MEM = os.getenv("MAINTENANCE_WORK_MEM", "1GB")
+MAX_PARALLEL_MAINTENANCE_WORKERS = int(os.getenv("MAX_PARALLEL_MAINTENANCE_WORKERS", "2"))
+INDEX_PROGRESS_INTERVAL = float(os.getenv("INDEX_PROGRESS_INTERVAL", "5"))
+# vector: chunk_vector vector(3072)をhalfvecにキャストして索引 / halfvec: chunk_vectorをhalfvec(3072)で保存
+VECTOR_COLUMN_TYPE = os.getenv("VECTOR_COLUMN_TYPE", "vector").lower()
+# halfvec時にfloat32のベクトルをchunk_vector_full列にも保存する
+KEEP_FULL_VECTORS = os.getenv("KEEP_FULL_VECTORS", "false").lower() == "true"
+# per_category: カテゴリごとの独立テーブル / partitioned: DOCUMENT_TABLE_NAMEをbusiness_categoryでLISTパーティション化
+TABLE_LAYOUT = os.getenv("TABLE_LAYOUT", "per_category").lower()
+# バックエンドが検索するテーブル (partitioned時は親テーブル)
+DOCUMENT_TABLE_NAME = os.getenv("DOCUMENT_TABLE_NAME", "document_vectors")
+# シャドウテーブルに投入・索引作成後、ビューを切り替えて公開 (直前の世代はロールバック用に保持)
+ENABLE_BLUE_GREEN = os.getenv("ENABLE_BLUE_GREEN", "false").lower() == "true"
+# csv_to_pgvectorの並列投入 (category: カテゴリ単位 / file: ファイル単位)
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "4"))
+INGEST_SHARD_MODE = os.getenv("INGEST_SHARD_MODE", "category").lower()
 
 # その他の設定
 BATCH_SIZE = int(os.getenv("BATCH_SIZE", "1000"))
+# csv_to_pgvectorが一度に読み込む行数 (メモリ使用量の上限を決める)
+LOAD_CHUNK_SIZE = int(os.getenv("LOAD_CHUNK_SIZE", str(BATCH_SIZE)))
+# バックエンドの検索結果キャッシュ件数 (0で無効、データ投入ごとに世代番号で全件破棄)
+SEARCH_RESULT_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_RESULT_CACHE_MAX_ENTRIES", "1000"))
+# WebSocketのバッチ検索 (questions) 1メッセージあたりの最大質問数
+BATCH_SEARCH_MAX_QUESTIONS = int(os.getenv("BATCH_SEARCH_MAX_QUESTIONS", "100"))
 POSTGRES_CONTAINER_NAME = os.getenv("POSTGRES_CONTAINER_NAME", "pgvector_db")
+# バックグラウンドでストリーミング取得するコンテナ統計のリングバッファ件数 (約1件/秒)
+CONTAINER_STATS_BUFFER_SIZE = int(os.getenv("CONTAINER_STATS_BUFFER_SIZE", "600"))
+# 検索終了後のサンプルを待つ最大秒数 (統計の保存のみ待ち、応答は待たない)
+CONTAINER_STATS_WAIT_TIMEOUT = float(os.getenv("CONTAINER_STATS_WAIT_TIMEOUT", "2"))
 SEARCH_CSV_OUTPUT_DIR = os.getenv("SEARCH_CSV_OUTPUT_DIR", '/app/data/search_csv')
 ENABLE_ALL_CSV = os.getenv("ENABLE_ALL_CSV", "false").lower() == "true"
 PIPELINE_EXECUTION_MODE = os.getenv("PIPELINE_EXECUTION_MODE", "csv_to_pgvector")
+
+# ストリーミング設定 (PIPELINE_EXECUTION_MODE=stream)
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", "4"))
+ENABLE_STREAM_CSV_SINK = os.getenv("ENABLE_STREAM_CSV_SINK", "false").lower() == "true"
+STREAM_MANIFEST_PATH = os.getenv("STREAM_MANIFEST_PATH", '/app/data/manifest/stream_manifest.json')
+# 取り込み世代を進める最小間隔 (秒)。ファイルのコミットごとに確認し、0 ならファイルごとに進める
+STREAM_PUBLISH_INTERVAL = float(os.getenv("STREAM_PUBLISH_INTERVAL", "30"))
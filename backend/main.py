@@ -3,7 +3,6 @@ from fastapi import FastAPI, WebSocket, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
-from openai import OpenAI, AzureOpenAI
 from starlette.websockets import WebSocketDisconnect
 import logging
 import time
@@ -11,8 +10,14 @@ import os
 import asyncio
 from io import BytesIO
 from pypdf import PdfReader, PdfWriter
-from utils.docker_stats_csv import save_memory_stats_with_extra_info, collect_memory_stats
-from utils.db_utils import get_db_connection, get_search_query, get_row_count
+from utils.docker_stats_csv import save_memory_stats_with_extra_info, ContainerStatsSampler
+from utils.query_embedding import open_client, close_client, embed_query, embed_queries, get_cache_stats
+from utils.db_utils import (
+    get_async_db_connection, async_search_chunks, async_batch_search_chunks, open_pool, close_pool, get_pool_stats,
+    get_connection_kwargs, get_search_params
+)
+from utils.search_cache import SearchResultCache, get_search_cache_key, listen_for_generations
+from utils.row_counts import RowCounts, async_get_row_counts
 from config import *
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -33,20 +38,70 @@ app.add_middleware(
 logger.info(f"Application initialized with INDEX_TYPE: {INDEX_TYPE}, "
             f"IVFFLAT_PROBES: {IVFFLAT_PROBES}, HNSW_EF_SEARCH: {HNSW_EF_SEARCH}")
 
-if ENABLE_OPENAI:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-else:
-    client = AzureOpenAI(
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        api_key=AZURE_OPENAI_API_KEY,
-        api_version=AZURE_OPENAI_API_VERSION
+search_cache = SearchResultCache(SEARCH_RESULT_CACHE_MAX_ENTRIES)
+row_counts = RowCounts()
+stats_sampler = ContainerStatsSampler(POSTGRES_CONTAINER_NAME, CONTAINER_STATS_BUFFER_SIZE)
+generation_listener = None
+
+async def refresh_row_counts(generation):
+    # num_of_rows for the stats CSVs, reloaded when an ingest bumps the generation instead of counted per search
+    global row_counts
+    try:
+        async with get_async_db_connection() as (conn, cursor):
+            row_counts = await async_get_row_counts(conn, DOCUMENT_TABLE_NAME)
+        logger.info(f"Loaded row counts of {DOCUMENT_TABLE_NAME} for generation {generation}: {row_counts.get()} rows")
+    except Exception as e:
+        logger.error(f"Error loading row counts: {e}")
+
+@app.on_event("startup")
+async def startup():
+    global generation_listener
+    stats_sampler.start()
+    open_client()
+    await open_pool()
+    generation_listener = asyncio.create_task(
+        listen_for_generations(search_cache, get_connection_kwargs(), on_generation=refresh_row_counts)
     )
 
-async def save_stats_async(stats, filename, row_count, search_time, question, filepath, page, target_rank):
+@app.on_event("shutdown")
+async def shutdown():
+    if generation_listener is not None:
+        generation_listener.cancel()
+    await close_pool()
+    await close_client()
+    stats_sampler.stop()
+
+@app.get("/stats/db_pool")
+async def db_pool_stats():
+    return get_pool_stats()
+
+@app.get("/stats/embedding_cache")
+async def embedding_cache_stats():
+    return get_cache_stats()
+
+@app.get("/stats/search_cache")
+async def search_cache_stats():
+    return search_cache.snapshot()
+
+@app.get("/stats/row_counts")
+async def row_count_stats():
+    return row_counts.snapshot()
+
+async def save_stats_async(stats, filename, row_count, search_time, question, filepath, page, target_rank, embedding_time=None, cache_hit=False):
     await asyncio.get_event_loop().run_in_executor(
-        None, save_memory_stats_with_extra_info, stats, filename, row_count, search_time, question, filepath, page, target_rank
+        None, save_memory_stats_with_extra_info, stats, filename, row_count, search_time, question, filepath, page, target_rank, embedding_time, cache_hit
     )
 
+async def save_search_stats(search_start, search_end, *args):
+    # Container samples bracketing the search, taken from the background sampler after the response is sent
+    before_search_stats = stats_sampler.get_sample_before(search_start)
+    after_search_stats = await stats_sampler.wait_for_sample_after(search_end, timeout=CONTAINER_STATS_WAIT_TIMEOUT)
+    if before_search_stats is None or after_search_stats is None:
+        logger.warning(f"No container stats sampled for {POSTGRES_CONTAINER_NAME}, search stats not saved")
+        return
+    await save_stats_async(before_search_stats, os.path.join(SEARCH_CSV_OUTPUT_DIR, 'before_search.csv'), *args)
+    await save_stats_async(after_search_stats, os.path.join(SEARCH_CSV_OUTPUT_DIR, 'after_search.csv'), *args)
+
 @app.get("/pdf/{path:path}")
 async def get_pdf(path: str, page: int = None):
     file_path = os.path.join("/app/data/pdf", path)
@@ -77,62 +132,142 @@ async def get_pdf(path: str, page: int = None):
         logger.error(f"Error serving PDF file: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error serving PDF file: {str(e)}")
 
+def format_results(results, filepath=None, page=None):
+    formatted_results = []
+    target_rank = None
+    for index, (file_name, document_page, chunk_no, chunk_text, distance) in enumerate(results, start=1):
+        result = {
+            "file_name": str(file_name),
+            "page": int(document_page),
+            "chunk_no": int(chunk_no),
+            "chunk_text": str(chunk_text),
+            "distance": float(distance),
+            "category": os.path.basename(os.path.dirname(file_name)),
+            "link_text": f"/{os.path.relpath(file_name, '/app/data/pdf')}, p.{document_page}",
+            "link": f"pdf/{os.path.relpath(file_name, '/app/data/pdf')}?page={document_page}",
+        }
+        formatted_results.append(result)
+
+        if filepath and page:
+            if os.path.basename(file_name) == os.path.basename(filepath) and int(document_page) == int(page):
+                target_rank = index
+    return formatted_results, target_rank
+
+async def batch_search(data, top_n, categories, use_cache=True):
+    # {"questions": [...]} where each item is a question string or {"question", "filepath", "page"}:
+    # one multi-input embedding call and one SQL statement for every question not in the result cache
+    items = [item if isinstance(item, dict) else {"question": item} for item in data["questions"]]
+    if not items or len(items) > BATCH_SEARCH_MAX_QUESTIONS:
+        raise ValueError(f"A batch needs 1 to {BATCH_SEARCH_MAX_QUESTIONS} questions, got {len(items)}")
+    question_vectors, embedding_time, embedding_caches = await embed_queries([item["question"] for item in items], use_cache)
+
+    start_time = time.time()
+    search_params = get_search_params()
+    cache_keys = [get_search_cache_key(vector, top_n, DOCUMENT_TABLE_NAME, categories, INDEX_TYPE, search_params)
+                  for vector in question_vectors]
+    results = [search_cache.get(key) if use_cache else None for key in cache_keys]
+    missing = [i for i, result in enumerate(results) if result is None]
+    if missing:
+        generation = search_cache.generation
+        async with get_async_db_connection() as (conn, cursor):
+            batch_results = await async_batch_search_chunks(cursor, INDEX_TYPE, [question_vectors[i] for i in missing], top_n, categories)
+            await conn.commit()
+        for i, result in zip(missing, batch_results):
+            results[i] = result
+            if use_cache:
+                search_cache.put(cache_keys[i], result, generation)
+    end_time = time.time()
+    search_time = end_time - start_time
+    row_count = row_counts.get(categories)
+
+    # The database and the embedding API each answer the whole batch at once, so per-question times are
+    # the batch time shared by the questions that needed that step
+    missing = set(missing)
+    responses = []
+    for i, (item, result) in enumerate(zip(items, results)):
+        formatted_results, target_rank = format_results(result, item.get("filepath"), item.get("page"))
+        question_search_time = round(search_time / len(missing), 4) if i in missing else 0.0
+        question_embedding_time = round(embedding_time / len(items), 4)
+        cache_hit = i not in missing
+        # One stats row per question, bracketed by the samples around the whole batch
+        asyncio.create_task(save_search_stats(start_time, end_time, row_count, question_search_time, item["question"],
+                                              item.get("filepath"), item.get("page"), target_rank,
+                                              question_embedding_time, cache_hit))
+        responses.append({
+            "question": item["question"],
+            "results": formatted_results,
+            "target_rank": target_rank,
+            "search_time": question_search_time,
+            "embedding_time": question_embedding_time,
+            "embedding_cache": embedding_caches[i],
+            "cache_hit": cache_hit
+        })
+    logger.info(f"Batch of {len(items)} questions: embedding {embedding_time:.4f}s, search {search_time:.4f}s "
+                f"({len(items) - len(missing)} result cache hits)")
+    return {
+        "batch": True,
+        "results": responses,
+        "search_time": round(search_time, 4),
+        "embedding_time": round(embedding_time, 4)
+    }
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
     try:
         while True:
             data = await websocket.receive_json()
-            question = data["question"]
             top_n = int(data.get("top_n", 20))
-            filepath = data.get("filepath")
-            page = data.get("page")
+            # Optional list of business_category values; only the matching partitions are searched
+            categories = data.get("categories") or None
+            if isinstance(categories, str):
+                categories = [categories]
+            # "no_cache": true skips both caches, so every question pays for its embedding and search (load tests)
+            use_cache = not data.get("no_cache", False)
 
-            question_vector = client.embeddings.create(
-                input=question,
-                model=AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT
-            ).data[0].embedding
+            if "questions" in data:
+                try:
+                    await websocket.send_json(await batch_search(data, top_n, categories, use_cache))
+                except Exception as e:
+                    logger.error(f"Error processing batch query: {str(e)}")
+                    logger.exception("Full traceback:")
+                    await websocket.send_json({"error": str(e)})
+                continue
 
-            logger.info(f"Attempting to get stats for container: {POSTGRES_CONTAINER_NAME}")
+            try:
+                # Embedding timeouts and API errors are answered like search errors, without closing the socket
+                question = data["question"]
+                filepath = data.get("filepath")
+                page = data.get("page")
 
-            before_search_stats = await collect_memory_stats(POSTGRES_CONTAINER_NAME, duration=1)
+                question_vector, embedding_time, embedding_cache = await embed_query(question, use_cache)
+                embedding_time = round(embedding_time, 4)
 
-            start_time = time.time()
-            try:
-                with get_db_connection() as (conn, cursor):
-                    row_count = int(get_row_count(cursor))
-                    cursor.execute(get_search_query(INDEX_TYPE), (question_vector, top_n))
-                    results = cursor.fetchall()
-                    conn.commit()
-
-                search_time = round(time.time() - start_time, 4)
-
-                after_search_stats = await collect_memory_stats(POSTGRES_CONTAINER_NAME, duration=1)
-
-                formatted_results = []
-                target_rank = None
-                for index, (file_name, document_page, chunk_no, chunk_text, distance) in enumerate(results, start=1):
-                    result = {
-                        "file_name": str(file_name),
-                        "page": int(document_page),
-                        "chunk_no": int(chunk_no),
-                        "chunk_text": str(chunk_text),
-                        "distance": float(distance),
-                        "category": os.path.basename(os.path.dirname(file_name)),
-                        "link_text": f"/{os.path.relpath(file_name, '/app/data/pdf')}, p.{document_page}",
-                        "link": f"pdf/{os.path.relpath(file_name, '/app/data/pdf')}?page={document_page}",
-                    }
-                    formatted_results.append(result)
-
-                    if filepath and page:
-                        if os.path.basename(file_name) == os.path.basename(filepath) and int(document_page) == int(page):
-                            target_rank = index
-
-                asyncio.create_task(save_stats_async(before_search_stats, os.path.join(SEARCH_CSV_OUTPUT_DIR, 'before_search.csv'), row_count, search_time, question, filepath, page, target_rank))
-                asyncio.create_task(save_stats_async(after_search_stats, os.path.join(SEARCH_CSV_OUTPUT_DIR, 'after_search.csv'), row_count, search_time, question, filepath, page, target_rank))
+                start_time = time.time()
+                cache_key = get_search_cache_key(question_vector, top_n, DOCUMENT_TABLE_NAME, categories, INDEX_TYPE, get_search_params())
+                results = search_cache.get(cache_key) if use_cache else None
+                cache_hit = results is not None
+                if not cache_hit:
+                    generation = search_cache.generation
+                    async with get_async_db_connection() as (conn, cursor):
+                        results = await async_search_chunks(cursor, INDEX_TYPE, question_vector, top_n, categories)
+                        await conn.commit()
+                    if use_cache:
+                        search_cache.put(cache_key, results, generation)
+                row_count = row_counts.get(categories)
+
+                end_time = time.time()
+                search_time = round(end_time - start_time, 4)
+
+                formatted_results, target_rank = format_results(results, filepath, page)
+
+                asyncio.create_task(save_search_stats(start_time, end_time, row_count, search_time, question, filepath, page, target_rank, embedding_time, cache_hit))
                 response_data = {
                     "results": formatted_results,
                     "search_time": search_time,
+                    "embedding_time": embedding_time,
+                    "embedding_cache": embedding_cache,
+                    "cache_hit": cache_hit,
                     "target_rank": target_rank
                 }
                 await websocket.send_json(response_data)
@@ -9,6 +9,8 @@ import logging
 from datetime import datetime
 import docker
 import re
+from utils.db_utils import search_chunks
+from utils.row_counts import get_row_counts
 
 CATEGORY_NAME = os.environ.get('CATEGORY_NAME', 'analytics_and_big_data')
 
@@ -86,17 +88,11 @@ def get_container_stats(container_name):
 
 def search_similar_chunks(cursor, query_vector, table_name, top_n=100):
     sanitized_table_name = sanitize_table_name(table_name)
-    vector_type = "halfvec(3072)" if INDEX_TYPE in ["hnsw", "ivfflat"] else "vector(3072)"
-    search_query = f"""
-    SELECT file_name, document_page, chunk_no, chunk_text,
-            (chunk_vector::{vector_type} <#> %s::{vector_type}) AS distance
-    FROM {sanitized_table_name}
-    ORDER BY distance ASC
-    LIMIT %s;
-    """
     try:
-        cursor.execute(search_query, (query_vector, top_n))
-        return cursor.fetchall()
+        if TABLE_LAYOUT == "partitioned":
+            # Categories are partitions of DOCUMENT_TABLE_NAME, selected by business_category
+            return search_chunks(cursor, INDEX_TYPE, query_vector, top_n, categories=[sanitized_table_name])
+        return search_chunks(cursor, INDEX_TYPE, query_vector, top_n, table_name=sanitized_table_name)
     except psycopg2.Error as e:
         logger.error(f"Database error during search: {str(e)}")
         raise
@@ -133,6 +129,9 @@ def process_search_csv():
 
     with get_db_connection() as conn:
         with conn.cursor() as cursor:
+            # Counted once from the ingest-maintained row counts instead of a COUNT(*) per search
+            num_of_rows = get_row_count(cursor, table_name)
+            conn.commit()
             for index, row in df.iterrows():
                 search_text = row['search_text']
                 file_name = row['file_name']
@@ -148,7 +147,7 @@ def process_search_csv():
                         'hnsw_ef_search': HNSW_EF_SEARCH,
                         'ivfflat_lists': IVFFLAT_LISTS,
                         'ivfflat_probes': IVFFLAT_PROBES,
-                        'num_of_rows': get_row_count(cursor, table_name),
+                        'num_of_rows': num_of_rows,
                         'search_time': search_time,
                         'target_rank': int(target_rank),
                         'keyword': search_text,
@@ -188,8 +187,9 @@ def process_search_csv():
 
 def get_row_count(cursor, table_name):
     sanitized_table_name = sanitize_table_name(table_name)
-    cursor.execute(f"SELECT COUNT(*) FROM {sanitized_table_name};")
-    return cursor.fetchone()[0]
+    if TABLE_LAYOUT == "partitioned":
+        return get_row_counts(cursor, DOCUMENT_TABLE_NAME).get([sanitized_table_name])
+    return get_row_counts(cursor, sanitized_table_name).get()
 
 def main():
     logger.info(f"Starting auto_search for category: {CATEGORY_NAME}")
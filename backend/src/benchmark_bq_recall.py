@@ -0,0 +1,97 @@
+# pgvector-ann/backend/src/benchmark_bq_recall.py
+# Recall@k, latency and index size of the hnsw index against the binary-quantized hnsw_bq index at several
+# oversampling factors, on query vectors sampled from an existing table. Ground truth is an exact scan.
+# Both indexes are created on the table if missing (this can take a while on large tables).
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from config import *
+from csv_to_pgvector import get_db_connection, sanitize_table_name, create_index, get_index_name
+from utils.db_utils import search_chunks
+
+BENCHMARK_TABLE = sanitize_table_name(os.getenv("BENCHMARK_TABLE", DOCUMENT_TABLE_NAME))
+BENCHMARK_QUERIES = int(os.getenv("BENCHMARK_QUERIES", "100"))
+BENCHMARK_TOP_K = int(os.getenv("BENCHMARK_TOP_K", "20"))
+BENCHMARK_OVERSAMPLING_FACTORS = [int(n) for n in os.getenv("BENCHMARK_OVERSAMPLING_FACTORS", "1,2,4,8,16").split(",")]
+BENCHMARK_OUTPUT_CSV = "/app/data/log/benchmark_bq_recall.csv"
+
+logging.basicConfig(filename="/app/data/log/benchmark_bq_recall.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+def get_chunk_key(row):
+    return row[0], int(row[1]), int(row[2])
+
+def sample_queries(cursor):
+    cursor.execute(f"SELECT chunk_vector FROM {BENCHMARK_TABLE} ORDER BY random() LIMIT %s;", (BENCHMARK_QUERIES,))
+    return [np.asarray(row[0], dtype=np.float32) for row in cursor.fetchall()]
+
+def exact_top_k(cursor, query_vectors):
+    # Sequential scan with exact inner product on the stored vectors
+    cursor.execute("SET LOCAL enable_indexscan = off;")
+    ground_truth = []
+    for vector in query_vectors:
+        rows = search_chunks(cursor, "none", vector, BENCHMARK_TOP_K, table_name=BENCHMARK_TABLE)
+        ground_truth.append({get_chunk_key(row) for row in rows})
+    return ground_truth
+
+def run_mode(cursor, index_type, query_vectors, ground_truth, oversampling_factor=None):
+    if index_type == "hnsw":
+        cursor.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH};")
+    latencies = []
+    recalls = []
+    for vector, expected in zip(query_vectors, ground_truth):
+        start_time = time.perf_counter()
+        rows = search_chunks(cursor, index_type, vector, BENCHMARK_TOP_K, table_name=BENCHMARK_TABLE,
+                             oversampling_factor=oversampling_factor or BQ_OVERSAMPLING_FACTOR)
+        latencies.append((time.perf_counter() - start_time) * 1000)
+        recalls.append(len(expected & {get_chunk_key(row) for row in rows}) / len(expected) if expected else 1.0)
+
+    cursor.execute("SELECT pg_relation_size(%s::regclass);", (get_index_name(BENCHMARK_TABLE, index_type),))
+    index_size = cursor.fetchone()[0]
+    return {
+        'table': BENCHMARK_TABLE,
+        'index_type': index_type,
+        'oversampling_factor': oversampling_factor,
+        'top_k': BENCHMARK_TOP_K,
+        'ef_search': HNSW_EF_SEARCH,
+        'queries': len(latencies),
+        'recall': round(float(np.mean(recalls)), 4) if recalls else None,
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2) if latencies else None,
+        'index_size_mb': round(index_size / 1024 ** 2, 2),
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def main():
+    results = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for index_type in ("hnsw", "hnsw_bq"):
+                create_index(cursor, BENCHMARK_TABLE, index_type)
+                conn.commit()
+
+            query_vectors = sample_queries(cursor)
+            ground_truth = exact_top_k(cursor, query_vectors)
+            conn.commit()
+            logger.info(f"Computed exact top-{BENCHMARK_TOP_K} for {len(query_vectors)} queries on {BENCHMARK_TABLE}")
+
+            modes = [("hnsw", None)] + [("hnsw_bq", factor) for factor in BENCHMARK_OVERSAMPLING_FACTORS]
+            for index_type, factor in modes:
+                result = run_mode(cursor, index_type, query_vectors, ground_truth, factor)
+                conn.commit()
+                logger.info(f"{index_type} (oversampling {factor}): recall@{BENCHMARK_TOP_K} {result['recall']}, "
+                            f"p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms, index {result['index_size_mb']}MB")
+                results.append(result)
+
+    pd.DataFrame(results).to_csv(BENCHMARK_OUTPUT_CSV, mode='a', header=not os.path.exists(BENCHMARK_OUTPUT_CSV), index=False)
+    logger.info(f"Benchmark results appended to {BENCHMARK_OUTPUT_CSV}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"Script execution failed: {e}")
+        exit(1)
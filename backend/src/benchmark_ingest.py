@@ -0,0 +1,102 @@
+# pgvector-ann/backend/src/benchmark_ingest.py
+# Compare the binary COPY loader with the previous executemany INSERT ... %s::vector(3072) path
+# on synthetic rows. Tables are created as bench_* and dropped afterwards.
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime, timezone
+from config import *
+from csv_to_pgvector import get_db_connection, create_table_and_index, copy_rows, compute_content_hash
+
+BENCHMARK_INGEST_ROWS = [int(n) for n in os.getenv("BENCHMARK_INGEST_ROWS", "10000,100000,1000000").split(",")]
+# The INSERT path takes hours at 1M rows, so it is skipped above this size
+BENCHMARK_INSERT_MAX_ROWS = int(os.getenv("BENCHMARK_INSERT_MAX_ROWS", "100000"))
+BENCHMARK_OUTPUT_CSV = "/app/data/log/benchmark_ingest.csv"
+
+logging.basicConfig(filename="/app/data/log/benchmark_ingest.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+def generate_rows(count, table_name, dim=3072):
+    rng = np.random.default_rng(0)
+    now = datetime.now(timezone.utc)
+    text = "lorem ipsum " * 80
+    for i in range(count):
+        vector = rng.standard_normal(dim, dtype=np.float32)
+        yield (
+            f"/app/data/pdf/benchmark/file_{i // 100}.pdf", i % 100 + 1, i + 1, text,
+            "text-embedding-3-large", 200, 200, now,
+            vector, table_name, compute_content_hash(text, vector)
+        )
+
+def insert_rows_legacy(cursor, table_name, rows):
+    # The pre-COPY path: parameterized INSERTs with vectors sent as list text and cast server-side
+    insert_query = f"""
+    INSERT INTO {table_name}
+    (file_name, document_page, chunk_no, chunk_text, model, prompt_tokens, total_tokens, created_date_time, chunk_vector, business_category, content_hash)
+    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s::vector(3072), %s, %s);
+    """
+    batch = []
+    count = 0
+    for row in rows:
+        batch.append(row[:8] + (str(row[8].tolist()),) + row[9:])
+        if len(batch) >= BATCH_SIZE:
+            cursor.executemany(insert_query, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        cursor.executemany(insert_query, batch)
+        count += len(batch)
+    return count
+
+def run_benchmark(conn, method, num_rows):
+    table_name = f"bench_{method}_{num_rows}"
+    with conn.cursor() as cursor:
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+        create_table_and_index(cursor, table_name)
+        conn.commit()
+
+        start_time = time.perf_counter()
+        if method == "copy":
+            rows = copy_rows(cursor, table_name, generate_rows(num_rows, table_name))
+        else:
+            rows = insert_rows_legacy(cursor, table_name, generate_rows(num_rows, table_name))
+        conn.commit()
+        elapsed = time.perf_counter() - start_time
+
+        cursor.execute(f"SELECT pg_total_relation_size('{table_name}');")
+        table_size = cursor.fetchone()[0]
+        cursor.execute(f"DROP TABLE IF EXISTS {table_name};")
+        conn.commit()
+
+    payload_mb = rows * (3072 * 4 + 1000) / 1024 ** 2
+    return {
+        'method': method,
+        'index_type': INDEX_TYPE,
+        'num_of_rows': rows,
+        'execution_time': round(elapsed, 2),
+        'rows_per_sec': round(rows / elapsed, 2) if elapsed > 0 else 0.0,
+        'mb_per_sec': round(payload_mb / elapsed, 2) if elapsed > 0 else 0.0,
+        'table_size_mb': round(table_size / 1024 ** 2, 2),
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def main():
+    results = []
+    with get_db_connection() as conn:
+        for num_rows in BENCHMARK_INGEST_ROWS:
+            for method in ("copy", "insert"):
+                if method == "insert" and num_rows > BENCHMARK_INSERT_MAX_ROWS:
+                    logger.info(f"Skipping insert benchmark at {num_rows} rows (BENCHMARK_INSERT_MAX_ROWS={BENCHMARK_INSERT_MAX_ROWS})")
+                    continue
+                result = run_benchmark(conn, method, num_rows)
+                logger.info(f"{method} {num_rows} rows: {result['execution_time']}s, {result['rows_per_sec']} rows/sec, "
+                            f"{result['mb_per_sec']} MB/sec")
+                results.append(result)
+
+    pd.DataFrame(results).to_csv(BENCHMARK_OUTPUT_CSV, mode='a', header=not os.path.exists(BENCHMARK_OUTPUT_CSV), index=False)
+    logger.info(f"Benchmark results appended to {BENCHMARK_OUTPUT_CSV}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# pgvector-ann/backend/src/benchmark_vector_storage.py
+# Compare write time, read time and bytes on disk of the chunk table formats on synthetic 3072-dim rows.
+import os
+import time
+import shutil
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from config import BATCH_SIZE
+from utils.vector_store import VectorTableWriter, iter_vector_table, get_vector_path
+
+BENCHMARK_ROWS = int(os.getenv("BENCHMARK_ROWS", "10000"))
+BENCHMARK_DIR = os.getenv("BENCHMARK_DIR", "/app/data/benchmark/vector_storage")
+BENCHMARK_OUTPUT_CSV = "/app/data/log/benchmark_vector_storage.csv"
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+def generate_rows(start, count, dim=3072):
+    rng = np.random.default_rng(start)
+    return pd.DataFrame({
+        'file_name': [f"/app/data/pdf/benchmark/file_{(start + i) // 100}.pdf" for i in range(count)],
+        'document_page': [(start + i) % 100 + 1 for i in range(count)],
+        'chunk_no': [start + i + 1 for i in range(count)],
+        'chunk_text': ["lorem ipsum " * 80 for _ in range(count)],
+        'model': "text-embedding-3-large",
+        'prompt_tokens': 200,
+        'total_tokens': 200,
+        'created_date_time': "2024-01-01 00:00:00 UTC",
+        'chunk_vector': rng.standard_normal((count, dim), dtype=np.float32).astype(np.float64).tolist()
+    })
+
+def benchmark_format(storage_format, dtype):
+    path = os.path.join(BENCHMARK_DIR, f"{storage_format}_{dtype}", "bench.csv")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    # Only writer calls are timed, not the generation of synthetic rows
+    write_time = 0.0
+    writer = VectorTableWriter(path, storage_format=storage_format, dtype=dtype)
+    for start in range(0, BENCHMARK_ROWS, BATCH_SIZE):
+        rows = generate_rows(start, min(BATCH_SIZE, BENCHMARK_ROWS - start))
+        start_time = time.perf_counter()
+        writer.write(rows)
+        write_time += time.perf_counter() - start_time
+    start_time = time.perf_counter()
+    writer.close()
+    write_time += time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    rows = 0
+    checksum = 0.0
+    for meta, vectors in iter_vector_table(path, BATCH_SIZE):
+        for vector in vectors:
+            checksum += float(np.asarray(vector, dtype=np.float32).sum())  # materialize every value, as the loader does
+        rows += len(meta)
+    read_time = time.perf_counter() - start_time
+
+    vector_path = get_vector_path(path)
+    size = os.path.getsize(path) + (os.path.getsize(vector_path) if os.path.exists(vector_path) else 0)
+    return {
+        'format': storage_format,
+        'dtype': dtype if storage_format == "npy" else "text",
+        'num_of_rows': rows,
+        'write_time': round(write_time, 4),
+        'read_time': round(read_time, 4),
+        'size_mb': round(size / 1024 ** 2, 2),
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+def main():
+    results = []
+    for storage_format, dtype in [("csv", "float32"), ("npy", "float32"), ("npy", "float16")]:
+        result = benchmark_format(storage_format, dtype)
+        logger.info(f"{result['format']}/{result['dtype']}: {result['num_of_rows']} rows, write {result['write_time']}s, "
+                    f"read {result['read_time']}s, {result['size_mb']}MB")
+        results.append(result)
+
+    df = pd.DataFrame(results)
+    df.to_csv(BENCHMARK_OUTPUT_CSV, mode='a', header=not os.path.exists(BENCHMARK_OUTPUT_CSV), index=False)
+    logger.info(f"Benchmark results appended to {BENCHMARK_OUTPUT_CSV}")
+    shutil.rmtree(BENCHMARK_DIR, ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
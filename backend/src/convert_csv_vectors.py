@@ -0,0 +1,60 @@
+# pgvector-ann/backend/src/convert_csv_vectors.py
+# Convert existing chunk CSVs under CSV_OUTPUT_DIR between text vectors (csv) and .npy sidecars (npy).
+# The target format and dtype are taken from VECTOR_STORAGE_FORMAT / VECTOR_STORAGE_DTYPE.
+import os
+import time
+import logging
+from config import *
+from utils.vector_store import VectorTableWriter, iter_vector_table, has_vector_sidecar, get_vector_path
+from utils.manifest import load_manifest, save_manifest, get_manifest_settings
+
+logging.basicConfig(filename="/app/data/log/convert_csv_vectors.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+def find_chunk_tables(directory):
+    for root, _, files in os.walk(directory):
+        for file in sorted(files):
+            if file.endswith('.csv'):
+                yield os.path.join(root, file)
+
+def get_table_size(path):
+    return os.path.getsize(path) + (os.path.getsize(get_vector_path(path)) if has_vector_sidecar(path) else 0)
+
+def convert_table(path):
+    writer = VectorTableWriter(path)
+    try:
+        for meta, vectors in iter_vector_table(path, BATCH_SIZE):
+            writer.write(meta.assign(chunk_vector=list(vectors)))
+        return writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+def main():
+    logger.info(f"Converting chunk tables in {CSV_OUTPUT_DIR} to {VECTOR_STORAGE_FORMAT} ({VECTOR_STORAGE_DTYPE})")
+    converted = 0
+    for path in find_chunk_tables(CSV_OUTPUT_DIR):
+        if VECTOR_STORAGE_FORMAT == "csv" and not has_vector_sidecar(path):
+            logger.info(f"Skipping {path}: already in {VECTOR_STORAGE_FORMAT} format")
+            continue
+        size_before = get_table_size(path)
+        start_time = time.time()
+        try:
+            rows = convert_table(path)
+        except Exception as e:
+            logger.error(f"Error converting {path}: {e}")
+            continue
+        size_after = get_table_size(path)
+        converted += 1
+        logger.info(f"Converted {path}: {rows} rows, {size_before / 1024 ** 2:.2f}MB -> {size_after / 1024 ** 2:.2f}MB "
+                    f"in {time.time() - start_time:.2f}s")
+
+    # Keep the vectorizer manifest valid so the next run does not treat every PDF as changed
+    manifest = load_manifest()
+    if manifest.get('settings'):
+        manifest['settings'].update({key: value for key, value in get_manifest_settings().items() if key.startswith('vector_storage')})
+        save_manifest(manifest)
+    logger.info(f"Conversion completed: {converted} tables converted")
+
+if __name__ == "__main__":
+    main()
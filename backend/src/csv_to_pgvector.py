@@ -1,12 +1,23 @@
 # pgvector-ann/backend/src/csv_to_pgvector.py
 import os
+import time
+import hashlib
+import resource
+import threading
+import numpy as np
 import pandas as pd
-import psycopg2
-from psycopg2.extras import execute_batch
+import psycopg
+from pgvector.psycopg import register_vector
 from config import *
 import logging
 from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, as_completed
 import re
+from utils.vector_store import iter_vector_table, has_vector_sidecar
+from utils.pipeline_summary import write_summary
+from utils.table_generations import get_shadow_name, drop_shadow, prewarm_table, swap_generation, check_not_generation_view
+from utils.search_cache import bump_ingest_generation
+from utils.row_counts import refresh_row_counts
 
 logging.basicConfig(filename="/app/data/log/csv_to_pgvector.log", level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,7 +26,7 @@ logger = logging.getLogger(__name__)
 def get_db_connection():
     conn = None
     try:
-        with psycopg2.connect(
+        with psycopg.connect(
             dbname=PGVECTOR_DB_NAME,
             user=PGVECTOR_DB_USER,
             password=PGVECTOR_DB_PASSWORD,
@@ -23,8 +34,11 @@ def get_db_connection():
             port=PGVECTOR_DB_PORT
         ) as conn:
             logger.info(f"Connected to database: {PGVECTOR_DB_HOST}:{PGVECTOR_DB_PORT}")
+            conn.execute("CREATE EXTENSION IF NOT EXISTS vector;")
+            register_vector(conn)  # binary dumpers for numpy arrays -> vector
+            conn.commit()
             yield conn
-    except (KeyError, psycopg2.Error) as e:
+    except (KeyError, psycopg.Error) as e:
         logger.error(f"Database connection error: {e}")
         raise
     finally:
@@ -38,11 +52,34 @@ def sanitize_table_name(name):
         sanitized = "t_" + sanitized
     return sanitized.lower()
 
-def create_table_and_index(cursor, table_name):
-    sanitized_table_name = sanitize_table_name(table_name)
-    create_table_query = f"""
-    CREATE TABLE IF NOT EXISTS {sanitized_table_name} (
-        id SERIAL PRIMARY KEY,
+# halfvec tables store the searchable vector as halfvec(3072) (6KB instead of 12KB per row) and index the
+# column directly; the float32 vector is optionally kept in chunk_vector_full for exact reranking.
+STORE_FULL_VECTORS = VECTOR_COLUMN_TYPE == "halfvec" and KEEP_FULL_VECTORS
+
+def get_vector_columns():
+    if VECTOR_COLUMN_TYPE == "halfvec":
+        return "chunk_vector halfvec(3072),\n        chunk_vector_full vector(3072)," if STORE_FULL_VECTORS else "chunk_vector halfvec(3072),"
+    return "chunk_vector vector(3072),"
+
+def get_index_expression():
+    return "chunk_vector halfvec_ip_ops" if VECTOR_COLUMN_TYPE == "halfvec" else "(chunk_vector::halfvec(3072)) halfvec_ip_ops"
+
+def check_vector_column(cursor, table_name):
+    # CREATE TABLE IF NOT EXISTS keeps an existing table as it is, so make sure it matches VECTOR_COLUMN_TYPE
+    cursor.execute("""
+    SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+    WHERE attrelid = %s::regclass AND attname = 'chunk_vector' AND NOT attisdropped;
+    """, (table_name,))
+    column_type = cursor.fetchone()[0]
+    expected_type = f"{VECTOR_COLUMN_TYPE}(3072)"
+    if column_type != expected_type:
+        raise ValueError(f"{table_name}.chunk_vector is {column_type} but VECTOR_COLUMN_TYPE expects {expected_type}; "
+                         f"run migrate_halfvec.py to convert existing tables")
+
+def get_table_columns(primary_key=True):
+    # A primary key on a partitioned table would have to include business_category, so the parent has none
+    return f"""
+        id SERIAL{' PRIMARY KEY' if primary_key else ''},
         file_name TEXT,
         document_page SMALLINT,
         chunk_no INTEGER,
@@ -51,115 +88,516 @@ def create_table_and_index(cursor, table_name):
         prompt_tokens INTEGER,
         total_tokens INTEGER,
         created_date_time TIMESTAMPTZ,
-        chunk_vector vector(3072),
-        business_category TEXT
-    );
+        {get_vector_columns()}
+        business_category TEXT,
+        content_hash TEXT
     """
+
+def get_partitioned_table():
+    # With ENABLE_BLUE_GREEN ingest writes into the shadow, and DOCUMENT_TABLE_NAME becomes a view
+    return get_shadow_name(DOCUMENT_TABLE_NAME) if ENABLE_BLUE_GREEN else DOCUMENT_TABLE_NAME
+
+def get_category_table(category):
+    # TABLE_LAYOUT=partitioned stores each category in a LIST partition of DOCUMENT_TABLE_NAME
+    category = sanitize_table_name(category)
+    if TABLE_LAYOUT == "partitioned":
+        return f"{get_partitioned_table()}_{category}"
+    return get_shadow_name(category) if ENABLE_BLUE_GREEN else category
+
+def create_partitioned_table(cursor):
+    partitioned_table_name = get_partitioned_table()
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {partitioned_table_name} ({get_table_columns(primary_key=False)})
+    PARTITION BY LIST (business_category);
+    """)
+    check_vector_column(cursor, partitioned_table_name)
+
+def create_table(cursor, table_name, category=None):
+    sanitized_table_name = sanitize_table_name(table_name)
+    if TABLE_LAYOUT == "partitioned" and category is not None:
+        create_partitioned_table(cursor)
+        # category is sanitized to [a-z0-9_], so it can be inlined as the partition bound
+        create_table_query = f"""
+        CREATE TABLE IF NOT EXISTS {sanitized_table_name}
+        PARTITION OF {get_partitioned_table()} FOR VALUES IN ('{sanitize_table_name(category)}');
+        """
+    else:
+        create_table_query = f"""
+        CREATE TABLE IF NOT EXISTS {sanitized_table_name} ({get_table_columns()});
+        """
     cursor.execute(create_table_query)
+    check_vector_column(cursor, sanitized_table_name)
+    ensure_chunk_key(cursor, sanitized_table_name)
     logger.info(f"Table {sanitized_table_name} created successfully")
 
-    if INDEX_TYPE == "hnsw":
+def ensure_chunk_key(cursor, table_name):
+    # Unique (file_name, document_page, chunk_no) key used by merge_rows. Tables created before the key
+    # existed get the content_hash column and are deduplicated (keeping the newest row) first.
+    key_index_name = f"{table_name}_chunk_key_idx"
+    cursor.execute("SELECT to_regclass(%s);", (key_index_name,))
+    if cursor.fetchone()[0] is not None:
+        return
+    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS content_hash TEXT;")
+    cursor.execute(f"""
+    DELETE FROM {table_name} a USING {table_name} b
+    WHERE a.file_name = b.file_name AND a.document_page = b.document_page AND a.chunk_no = b.chunk_no
+      AND a.id < b.id;
+    """)
+    if cursor.rowcount:
+        logger.info(f"Removed {cursor.rowcount} duplicate chunk rows from {table_name}")
+    cursor.execute(f"CREATE UNIQUE INDEX {key_index_name} ON {table_name} (file_name, document_page, chunk_no);")
+
+def get_index_name(table_name, index_type=INDEX_TYPE):
+    return f"{index_type}_{sanitize_table_name(table_name)}_chunk_vector_idx"
+
+def create_index(cursor, table_name, index_type=INDEX_TYPE):
+    sanitized_table_name = sanitize_table_name(table_name)
+    if index_type == "hnsw":
         create_index_query = f"""
-        CREATE INDEX IF NOT EXISTS hnsw_{sanitized_table_name}_chunk_vector_idx ON {sanitized_table_name}
-        USING hnsw ((chunk_vector::halfvec(3072)) halfvec_ip_ops)
+        CREATE INDEX IF NOT EXISTS {get_index_name(table_name, index_type)} ON {sanitized_table_name}
+        USING hnsw ({get_index_expression()})
         WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
         """
         cursor.execute(create_index_query)
         logger.info(f"HNSW index created successfully for {sanitized_table_name} with parameters: m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}")
-    elif INDEX_TYPE == "ivfflat":
+    elif index_type == "hnsw_bq":
+        # 1 bit per dimension: 384 bytes per 3072-dim vector instead of 6KB for halfvec
+        create_index_query = f"""
+        CREATE INDEX IF NOT EXISTS {get_index_name(table_name, index_type)} ON {sanitized_table_name}
+        USING hnsw ((binary_quantize(chunk_vector)::bit(3072)) bit_hamming_ops)
+        WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION});
+        """
+        cursor.execute(create_index_query)
+        logger.info(f"Binary-quantized HNSW index created successfully for {sanitized_table_name} with parameters: m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}")
+    elif index_type == "ivfflat":
         create_index_query = f"""
-        CREATE INDEX IF NOT EXISTS ivfflat_{sanitized_table_name}_chunk_vector_idx ON {sanitized_table_name}
-        USING ivfflat ((chunk_vector::halfvec(3072)) halfvec_ip_ops)
+        CREATE INDEX IF NOT EXISTS {get_index_name(table_name, index_type)} ON {sanitized_table_name}
+        USING ivfflat ({get_index_expression()})
         WITH (lists = {IVFFLAT_LISTS});
         """
         cursor.execute(create_index_query)
         logger.info(f"IVFFlat index created successfully for {sanitized_table_name} with parameter: lists = {IVFFLAT_LISTS}")
-    elif INDEX_TYPE == "none":
+    elif index_type == "none":
         logger.info(f"No index created for {sanitized_table_name} as per configuration")
     else:
-        raise ValueError(f"Unsupported index type: {INDEX_TYPE}")
+        raise ValueError(f"Unsupported index type: {index_type}")
 
-def process_csv_file(file_path, cursor, table_name):
-    logger.info(f"Processing CSV file: {file_path}")
-    df = pd.read_csv(file_path)
+def create_table_and_index(cursor, table_name, category=None):
+    create_table(cursor, table_name, category)
+    create_index(cursor, table_name)
 
-    sanitized_table_name = sanitize_table_name(table_name)
-    insert_query = f"""
-    INSERT INTO {sanitized_table_name}
-    (file_name, document_page, chunk_no, chunk_text, model, prompt_tokens, total_tokens, created_date_time, chunk_vector, business_category)
-    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s::vector(3072), %s);
-    """
+# Shadow tables are never searched before the swap, so their index is always built after loading
+DEFER_INDEX_BUILD = INDEX_BUILD_MODE == "deferred" or ENABLE_BLUE_GREEN
+
+def prepare_table(cursor, category):
+    # Creates the table (or partition) of a category and returns its name. In deferred mode the index is
+    # built by build_index after the heap is loaded. Partitions get their own index, so each category's
+    # graph stays small and a category filter only scans the matching partitions.
+    table_name = get_category_table(category)
+    if DEFER_INDEX_BUILD:
+        create_table(cursor, table_name, category)
+    else:
+        create_table_and_index(cursor, table_name, category)
+    return table_name
+
+def monitor_index_build(pid, stop_event):
+    # Polls pg_stat_progress_create_index for the building backend on a separate connection
+    try:
+        with psycopg.connect(
+            dbname=PGVECTOR_DB_NAME,
+            user=PGVECTOR_DB_USER,
+            password=PGVECTOR_DB_PASSWORD,
+            host=PGVECTOR_DB_HOST,
+            port=PGVECTOR_DB_PORT,
+            autocommit=True
+        ) as conn:
+            last_progress = None
+            while not stop_event.wait(INDEX_PROGRESS_INTERVAL):
+                row = conn.execute("""
+                SELECT phase, blocks_done, blocks_total, tuples_done, tuples_total
+                FROM pg_stat_progress_create_index WHERE pid = %s;
+                """, (pid,)).fetchone()
+                if row is None or row == last_progress:
+                    continue
+                last_progress = row
+                phase, blocks_done, blocks_total, tuples_done, tuples_total = row
+                blocks_pct = f"{100 * blocks_done / blocks_total:.1f}%" if blocks_total else "-"
+                tuples_pct = f"{100 * tuples_done / tuples_total:.1f}%" if tuples_total else "-"
+                logger.info(f"Index build progress: phase={phase}, blocks {blocks_done}/{blocks_total} ({blocks_pct}), "
+                            f"tuples {tuples_done}/{tuples_total} ({tuples_pct})")
+    except psycopg.Error as e:
+        logger.warning(f"Index build progress monitor stopped: {e}")
+
+def build_index(conn, table_name):
+    # Build the vector index on a loaded table with session-level maintenance settings.
+    # Returns dict(table, index, build_time, index_size), or None when INDEX_TYPE is none or the index already
+    # exists (re-runs merge into existing tables), so no build time is reported for an index that was not built.
+    if INDEX_TYPE == "none":
+        logger.info(f"No index created for {sanitize_table_name(table_name)} as per configuration")
+        return None
+
+    index_name = get_index_name(table_name)
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT to_regclass(%s);", (index_name,))
+        index_exists = cursor.fetchone()[0] is not None
+    conn.commit()
+    if index_exists:
+        logger.info(f"Index {index_name} already exists, skipping build")
+        return None
+
+    with conn.cursor() as cursor:
+        cursor.execute("SELECT set_config('maintenance_work_mem', %s, false);", (MAINTENANCE_WORK_MEM,))
+        cursor.execute("SELECT set_config('max_parallel_maintenance_workers', %s, false);", (str(MAX_PARALLEL_MAINTENANCE_WORKERS),))
+        logger.info(f"Building {INDEX_TYPE.upper()} index on {sanitize_table_name(table_name)} with "
+                    f"maintenance_work_mem = {MAINTENANCE_WORK_MEM}, max_parallel_maintenance_workers = {MAX_PARALLEL_MAINTENANCE_WORKERS}")
+
+        stop_event = threading.Event()
+        monitor = threading.Thread(target=monitor_index_build, args=(conn.info.backend_pid, stop_event), daemon=True)
+        monitor.start()
+        start_time = time.perf_counter()
+        try:
+            create_index(cursor, table_name)
+            conn.commit()
+        finally:
+            stop_event.set()
+            monitor.join()
+        build_time = time.perf_counter() - start_time
+
+        cursor.execute("SELECT pg_relation_size(%s::regclass);", (index_name,))
+        index_size = cursor.fetchone()[0]
+    logger.info(f"Index {index_name} built in {build_time:.2f}s, size {index_size / 1024 ** 2:.2f}MB")
+    return {'table': sanitize_table_name(table_name), 'index': index_name, 'build_time': build_time, 'index_size': index_size}
 
-    data = []
-    for _, row in df.iterrows():
-        embedding = row['chunk_vector']
-        if isinstance(embedding, str):
-            embedding = eval(embedding)
-        if len(embedding) != 3072:
-            logger.warning(f"Incorrect vector dimension for row. Expected 3072, got {len(embedding)}. Skipping.")
-            continue
+COPY_COLUMNS = ["file_name", "document_page", "chunk_no", "chunk_text", "model", "prompt_tokens", "total_tokens",
+                "created_date_time", "chunk_vector", "business_category", "content_hash"]
+COPY_TYPES = ["text", "int2", "int4", "text", "text", "int4", "int4", "timestamptz", "vector", "text", "text"]
+if VECTOR_COLUMN_TYPE == "halfvec":
+    COPY_TYPES[8] = "halfvec"
+if STORE_FULL_VECTORS:
+    COPY_COLUMNS.append("chunk_vector_full")
+    COPY_TYPES.append("vector")
 
-        business_category = row.get('business_category', table_name)
+class CopyStats:
+    def __init__(self):
+        self.rows = 0
+        self.bytes = 0
+        self.started = time.perf_counter()
 
-        data.append((
-            row['file_name'], row['document_page'], row['chunk_no'], row['chunk_text'],
-            row['model'], row['prompt_tokens'], row['total_tokens'], row['created_date_time'],
-            embedding, business_category
-        ))
+    def add(self, row):
+        # Approximate wire size: text columns, 22 bytes of int/timestamp fields and the float4 vector payload
+        self.rows += 1
+        self.bytes += len(row[0]) + len(row[3]) + len(row[4]) + len(str(row[9])) + len(row[10]) + 22 + 4 + 4 * len(row[8])
 
+    def log(self, table_name):
+        elapsed = time.perf_counter() - self.started
+        rows_per_sec = self.rows / elapsed if elapsed > 0 else 0.0
+        mb_per_sec = self.bytes / 1024 ** 2 / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Copied {self.rows} rows ({self.bytes / 1024 ** 2:.2f}MB) into {table_name} in {elapsed:.2f}s "
+                    f"({rows_per_sec:.2f} rows/sec, {mb_per_sec:.2f} MB/sec)")
+
+def compute_content_hash(chunk_text, vector):
+    # Identifies the content of a chunk, so re-ingesting an unchanged chunk can be skipped
+    digest = hashlib.sha256(chunk_text.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(np.asarray(vector, dtype=np.float32).tobytes())
+    return digest.hexdigest()
+
+def copy_rows(cursor, table_name, rows):
+    # rows: iterable of (file_name, document_page, chunk_no, chunk_text, model, prompt_tokens, total_tokens,
+    #                    created_date_time, chunk_vector, business_category, content_hash) tuples,
+    #       streamed into a binary COPY
+    sanitized_table_name = sanitize_table_name(table_name)
+    stats = CopyStats()
     try:
-        execute_batch(cursor, insert_query, data, page_size=BATCH_SIZE)
-        logger.info(f"Inserted {len(data)} rows into the {sanitized_table_name} table")
+        with cursor.copy(f"COPY {sanitized_table_name} ({', '.join(COPY_COLUMNS)}) FROM STDIN WITH (FORMAT BINARY)") as copy:
+            copy.set_types(COPY_TYPES)
+            for row in rows:
+                copy.write_row(row + (row[8],) if STORE_FULL_VECTORS else row)
+                stats.add(row)
     except Exception as e:
-        logger.error(f"Error inserting batch into {sanitized_table_name}: {e}")
+        logger.error(f"Error copying rows into {sanitized_table_name}: {e}")
         raise
+    stats.log(sanitized_table_name)
+    return stats.rows
+
+def iter_csv_rows(file_path, category):
+    # Yield COPY rows of one chunk table, reading and validating LOAD_CHUNK_SIZE rows at a time, so
+    # memory stays flat regardless of file size (the COPY consumes rows as they are produced)
+    for meta, vectors in iter_vector_table(file_path, LOAD_CHUNK_SIZE):
+        created = pd.to_datetime(meta['created_date_time'], utc=True)
+        for row, created_date_time, embedding in zip(meta.to_dict('records'), created, vectors):
+            if len(embedding) != 3072:
+                logger.warning(f"Incorrect vector dimension for row. Expected 3072, got {len(embedding)}. Skipping.")
+                continue
+
+            business_category = row.get('business_category', category)
+            vector = np.asarray(embedding, dtype=np.float32)
+
+            yield (
+                row['file_name'], int(row['document_page']), int(row['chunk_no']), row['chunk_text'],
+                row['model'], int(row['prompt_tokens']), int(row['total_tokens']), created_date_time.to_pydatetime(),
+                vector, business_category, compute_content_hash(row['chunk_text'], vector)
+            )
+
+def merge_rows(cursor, table_name, rows):
+    # COPY rows into a staging table, then merge them into table_name in three set-based statements:
+    # insert new chunks, update chunks whose content_hash changed, and delete chunks of the staged
+    # files that are no longer present. Unchanged rows are not written at all.
+    sanitized_table_name = sanitize_table_name(table_name)
+    staging_table_name = f"staging_{sanitized_table_name}"
+    columns = ', '.join(COPY_COLUMNS)
+    cursor.execute(f"""
+    CREATE TEMP TABLE {staging_table_name} ON COMMIT DROP AS
+    SELECT {columns} FROM {sanitized_table_name} WITH NO DATA;
+    """)
+    staged = copy_rows(cursor, staging_table_name, rows)
+
+    updates = ', '.join(f"{column} = EXCLUDED.{column}" for column in COPY_COLUMNS[3:])
+    cursor.execute(f"""
+    WITH upserted AS (
+        INSERT INTO {sanitized_table_name} ({columns})
+        SELECT DISTINCT ON (file_name, document_page, chunk_no) {columns} FROM {staging_table_name}
+        ORDER BY file_name, document_page, chunk_no
+        ON CONFLICT (file_name, document_page, chunk_no) DO UPDATE SET {updates}
+        WHERE {sanitized_table_name}.content_hash IS DISTINCT FROM EXCLUDED.content_hash
+        RETURNING (xmax = 0) AS inserted
+    )
+    SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted;
+    """)
+    inserted, updated = cursor.fetchone()
+
+    cursor.execute(f"""
+    DELETE FROM {sanitized_table_name} t
+    WHERE t.file_name IN (SELECT DISTINCT file_name FROM {staging_table_name})
+      AND NOT EXISTS (
+        SELECT 1 FROM {staging_table_name} s
+        WHERE s.file_name = t.file_name AND s.document_page = t.document_page AND s.chunk_no = t.chunk_no
+      );
+    """)
+    deleted = cursor.rowcount
+
+    cursor.execute(f"SELECT DISTINCT file_name FROM {staging_table_name};")
+    file_names = [row[0] for row in cursor.fetchall()]
+    logger.info(f"Merged {staged} rows into {sanitized_table_name}: {inserted} inserted, {updated} updated, "
+                f"{staged - inserted - updated} unchanged, {deleted} deleted")
+    return {'rows': staged, 'inserted': inserted, 'updated': updated, 'deleted': deleted, 'file_names': file_names}
+
+def delete_missing_files(cursor, table_name, file_names):
+    # Remove rows of source files that are no longer part of the corpus
+    sanitized_table_name = sanitize_table_name(table_name)
+    cursor.execute(f"DELETE FROM {sanitized_table_name} WHERE NOT (file_name = ANY(%s));", (list(file_names),))
+    if cursor.rowcount:
+        logger.info(f"Deleted {cursor.rowcount} rows of removed files from {sanitized_table_name}")
+    return cursor.rowcount
+
+def process_csv_file(file_path, cursor, category):
+    logger.info(f"Processing CSV file: {file_path} (vector sidecar: {has_vector_sidecar(file_path)})")
+    return merge_rows(cursor, get_category_table(category), iter_csv_rows(file_path, category))
+
+def load_files(conn, category, file_paths):
+    # Load files into the existing table of a category, committing each file on its own so one bad file does
+    # not discard the others. Returns dict(table, rows, inserted, updated, deleted, files, failed, file_names).
+    result = {'table': get_category_table(category), 'rows': 0, 'inserted': 0, 'updated': 0, 'deleted': 0, 'files': 0,
+              'failed': [], 'file_names': []}
+    with conn.cursor() as cursor:
+        for file_path in file_paths:
+            try:
+                merged = process_csv_file(file_path, cursor, category)
+                conn.commit()
+                for key in ('rows', 'inserted', 'updated', 'deleted', 'file_names'):
+                    result[key] += merged[key]
+                result['files'] += 1
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error processing {file_path}: {e}")
+                result['failed'].append(file_path)
+    return result
+
+def load_category(category, file_paths):
+    # Worker task for INGEST_SHARD_MODE=category: one connection creates and loads a whole table
+    start_time = time.perf_counter()
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            table_name = prepare_table(cursor, category)
+        conn.commit()
+        result = load_files(conn, category, file_paths)
+    logger.info(f"Loaded {result['rows']} rows from {result['files']} files into {table_name} "
+                f"in {time.perf_counter() - start_time:.2f}s (pid {os.getpid()})")
+    return result
+
+def load_file(category, file_path):
+    # Worker task for INGEST_SHARD_MODE=file: the table already exists, so files of one table load concurrently
+    with get_db_connection() as conn:
+        return load_files(conn, category, [file_path])
+
+def build_table_index(table_name):
+    with get_db_connection() as conn:
+        return build_index(conn, table_name)
+
+def get_category_files():
+    # {category: [csv paths]} for every category directory except "all"
+    category_files = {}
+    for category in sorted(os.listdir(CSV_OUTPUT_DIR)):
+        category_dir = os.path.join(CSV_OUTPUT_DIR, category)
+        if os.path.isdir(category_dir) and category.lower() != "all":
+            category_files[sanitize_table_name(category)] = sorted(
+                os.path.join(category_dir, file) for file in os.listdir(category_dir) if file.endswith('.csv')
+            )
+    return category_files
 
 def process_all_csv(conn):
     logger.info("Processing all.csv file")
     all_csv_path = os.path.join(CSV_OUTPUT_DIR, "all", "all.csv")
     if os.path.exists(all_csv_path):
         with conn.cursor() as cursor:
-            table_name = sanitize_table_name("all_data")  # Use "all_data" instead of "all"
-            create_table_and_index(cursor, table_name)
-            process_csv_file(all_csv_path, cursor, table_name)
+            category = "all_data"  # Use "all_data" instead of "all"
+            table_name = prepare_table(cursor, category)
+            merged = process_csv_file(all_csv_path, cursor, category)
+            delete_missing_files(cursor, table_name, merged['file_names'])
             conn.commit()
+        return [table_name], []
     else:
         logger.error(f"all.csv file not found at {all_csv_path}")
         raise FileNotFoundError(f"all.csv file not found at {all_csv_path}")
 
+def process_categories(executor):
+    # Fan category tables (or individual files) out across INGEST_WORKERS connections
+    category_files = get_category_files()
+    futures = {}
+    # Partitions are created up front as well, since concurrent CREATE ... PARTITION OF would contend on the parent
+    if INGEST_SHARD_MODE == "file" or TABLE_LAYOUT == "partitioned":
+        with get_db_connection() as conn:
+            with conn.cursor() as cursor:
+                for category in category_files:
+                    prepare_table(cursor, category)
+            conn.commit()
+    if INGEST_SHARD_MODE == "file":
+        for category, file_paths in category_files.items():
+            for file_path in file_paths:
+                futures[executor.submit(load_file, category, file_path)] = get_category_table(category)
+    else:
+        for category, file_paths in category_files.items():
+            logger.info(f"Processing category: {category} ({len(file_paths)} files)")
+            futures[executor.submit(load_category, category, file_paths)] = get_category_table(category)
+
+    tables = set()
+    file_names = {table_name: set() for table_name in futures.values()}
+    failed_tables = set()
+    for future in as_completed(futures):
+        table_name = futures[future]
+        try:
+            result = future.result()
+            tables.add(table_name)
+            file_names[table_name].update(result['file_names'])
+            if result['failed']:
+                failed_tables.add(table_name)
+                logger.error(f"{len(result['failed'])} files failed to load into {table_name}: {result['failed']}")
+        except Exception as e:
+            failed_tables.add(table_name)
+            logger.error(f"Error processing table {table_name}: {e}")
+
+    # Rows of files that were not loaded this run are only removed when every file of the table succeeded
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            for table_name in sorted(tables - failed_tables):
+                delete_missing_files(cursor, table_name, file_names[table_name])
+        conn.commit()
+    return sorted(tables), sorted(failed_tables)
+
+def get_base_tables():
+    # Names the backend searches (views once blue/green is in use) for the tables this run rebuilds
+    if TABLE_LAYOUT == "partitioned":
+        return [DOCUMENT_TABLE_NAME]
+    if ENABLE_ALL_CSV:
+        return ["all_data"]
+    return list(get_category_files())
+
+def swap_generations(failed_tables):
+    # Prewarm each fully loaded shadow and swap it in; a base with failed files keeps its current generation
+    with get_db_connection() as conn:
+        for base_name in get_base_tables():
+            shadow_name = get_shadow_name(base_name)
+            failed = [t for t in failed_tables if t == shadow_name or t.startswith(f"{shadow_name}_")]
+            if failed:
+                logger.error(f"Not swapping {base_name}: {failed} failed to load, {shadow_name} is left for inspection")
+                continue
+            prewarm_table(conn, shadow_name)
+            swap_generation(conn, base_name)
+
+def get_peak_rss_mb():
+    # Largest of this process and the (already finished) ingest workers; ru_maxrss is in KB on Linux
+    return max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+
+def publish_ingest():
+    # Row counts for the backend's stats, then invalidate its search-result cache
+    with get_db_connection() as conn:
+        refresh_row_counts(conn, get_base_tables())
+        bump_ingest_generation(conn, "csv_to_pgvector.py")
+
 def process_csv_files():
-    logger.info(f"Processing with ENABLE_ALL_CSV: {ENABLE_ALL_CSV}")
+    logger.info(f"Processing with ENABLE_ALL_CSV: {ENABLE_ALL_CSV}, TABLE_LAYOUT: {TABLE_LAYOUT}, "
+                f"INDEX_BUILD_MODE: {INDEX_BUILD_MODE}, INGEST_WORKERS: {INGEST_WORKERS}, INGEST_SHARD_MODE: {INGEST_SHARD_MODE}")
+    if ENABLE_ALL_CSV and TABLE_LAYOUT == "partitioned":
+        logger.warning(f"ENABLE_ALL_CSV is ignored with TABLE_LAYOUT=partitioned: {DOCUMENT_TABLE_NAME} already "
+                       f"covers every category, so the category CSVs are loaded into its partitions")
+    start_time = time.perf_counter()
+    # Set once rows may have been committed to the live tables; those are searchable even if a later table fails
+    live_tables_changed = False
+    failed = False
 
     try:
         with get_db_connection() as conn:
-            if ENABLE_ALL_CSV:
-                process_all_csv(conn)
+            with conn.cursor() as cursor:
+                for base_name in get_base_tables():
+                    if ENABLE_BLUE_GREEN:
+                        drop_shadow(cursor, base_name)
+                    else:
+                        check_not_generation_view(cursor, base_name)
+            conn.commit()
+        if ENABLE_BLUE_GREEN:
+            logger.info(f"Blue/green ingest into shadow tables of {get_base_tables()}")
+
+        with ProcessPoolExecutor(max_workers=INGEST_WORKERS) as executor:
+            live_tables_changed = not ENABLE_BLUE_GREEN
+            if ENABLE_ALL_CSV and TABLE_LAYOUT != "partitioned":
+                with get_db_connection() as conn:
+                    tables, failed_tables = process_all_csv(conn)
             else:
-                for category in os.listdir(CSV_OUTPUT_DIR):
-                    category_dir = os.path.join(CSV_OUTPUT_DIR, category)
-                    if os.path.isdir(category_dir) and category.lower() != "all":
-                        logger.info(f"Processing category: {category}")
-                        with conn.cursor() as cursor:
-                            table_name = sanitize_table_name(category)
-                            create_table_and_index(cursor, table_name)
-                            for file in os.listdir(category_dir):
-                                if file.endswith('.csv'):
-                                    csv_file_path = os.path.join(category_dir, file)
-                                    try:
-                                        process_csv_file(csv_file_path, cursor, table_name)
-                                        conn.commit()
-                                    except Exception as e:
-                                        conn.rollback()
-                                        logger.error(f"Error processing {csv_file_path}: {e}")
-
-            logger.info(f"CSV files have been processed and inserted into the database with {INDEX_TYPE.upper()} index.")
-            if INDEX_TYPE == "hnsw":
-                logger.info(f"HNSW index parameters: m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}")
-            elif INDEX_TYPE == "ivfflat":
-                logger.info(f"IVFFlat index parameter: lists = {IVFFLAT_LISTS}")
+                tables, failed_tables = process_categories(executor)
+            logger.info(f"Loaded {len(tables)} tables in {time.perf_counter() - start_time:.2f}s")
+
+            index_builds = []
+            if DEFER_INDEX_BUILD:
+                for index_build in executor.map(build_table_index, tables):
+                    if index_build:
+                        index_builds.append(index_build)
+
+        if ENABLE_BLUE_GREEN:
+            live_tables_changed = True
+            swap_generations(failed_tables)
+        peak_rss_mb = get_peak_rss_mb()
+        logger.info(f"Peak RSS: {peak_rss_mb:.1f}MB (LOAD_CHUNK_SIZE: {LOAD_CHUNK_SIZE})")
+        write_summary("csv_to_pgvector.py", {'index_builds': index_builds, 'peak_rss_mb': peak_rss_mb})
+
+        logger.info(f"CSV files have been processed and inserted into the database with {INDEX_TYPE.upper()} index.")
+        if INDEX_TYPE in ["hnsw", "hnsw_bq"]:
+            logger.info(f"HNSW index parameters: m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION}")
+        elif INDEX_TYPE == "ivfflat":
+            logger.info(f"IVFFlat index parameter: lists = {IVFFLAT_LISTS}")
     except Exception as e:
+        failed = True
         logger.error(f"An error occurred during processing: {e}")
         raise
+    finally:
+        if live_tables_changed:
+            try:
+                publish_ingest()
+            except Exception as e:
+                logger.error(f"Failed to publish the ingest generation: {e}")
+                # After a failed load the original error is the one to report
+                if not failed:
+                    raise
 
 if __name__ == "__main__":
     try:
@@ -2,6 +2,7 @@ import os
 import psycopg
 from psycopg import sql
 import logging
+from utils.search_cache import bump_ingest_generation
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -19,7 +20,7 @@ def get_all_public_tables(cursor):
     cursor.execute("""
     SELECT table_name
     FROM information_schema.tables
-    WHERE table_schema = 'public'
+    WHERE table_schema = 'public' AND table_type = 'BASE TABLE' AND table_name <> 'ingest_generation'
     """)
     return [row[0] for row in cursor.fetchall()]
 
@@ -43,6 +44,8 @@ def main():
                     drop_all_tables(cursor, tables)
                     conn.commit()
                     logger.info(f"Deleted a total of {len(tables)} tables.")
+                    # The generation counter is kept and bumped so the backend drops results of the deleted tables
+                    bump_ingest_generation(conn, "drop_table_psycopg.py")
     except psycopg.Error as e:
         logger.error(f"An error occurred during database operation: {e}")
     except Exception as e:
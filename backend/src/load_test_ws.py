@@ -0,0 +1,118 @@
+# pgvector-ann/backend/src/load_test_ws.py
+# Concurrent WebSocket clients against the backend's /ws endpoint. For each concurrency level, every client
+# sends LOAD_TEST_REQUESTS questions back to back. If queries overlap, the summed client latency is roughly
+# concurrency x wall time (overlap close to the concurrency). If they serialize on the server, it drops to about 1.
+# With LOAD_TEST_BATCH_SIZE > 1 every level is run again with each client sending the same questions as
+# {"questions": [...]} batches, to compare question throughput of the batch path with the sequential one.
+# Every message carries "no_cache": true, so a run is not answered from caches warmed by the runs before it;
+# the comparison is refused if any response still reports a cache hit (a backend without that flag).
+import os
+import json
+import time
+import asyncio
+import logging
+import numpy as np
+import pandas as pd
+import websockets
+from datetime import datetime
+
+CATEGORY_NAME = os.environ.get('CATEGORY_NAME', 'analytics_and_big_data')
+LOAD_TEST_URL = os.getenv("LOAD_TEST_URL", "ws://localhost:8001/ws")
+LOAD_TEST_CONCURRENCY = [int(n) for n in os.getenv("LOAD_TEST_CONCURRENCY", "1,4,16").split(",")]
+LOAD_TEST_REQUESTS = int(os.getenv("LOAD_TEST_REQUESTS", "10"))
+LOAD_TEST_TOP_N = int(os.getenv("LOAD_TEST_TOP_N", "20"))
+LOAD_TEST_BATCH_SIZE = int(os.getenv("LOAD_TEST_BATCH_SIZE", "10"))
+LOAD_TEST_SEARCH_CSV = f'../data/search_csv/search_{CATEGORY_NAME}.csv'
+LOAD_TEST_OUTPUT_CSV = "/app/data/log/load_test_ws.csv"
+
+logging.basicConfig(filename="/app/data/log/load_test_ws.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+def load_questions():
+    if os.path.exists(LOAD_TEST_SEARCH_CSV):
+        questions = pd.read_csv(LOAD_TEST_SEARCH_CSV)['search_text'].dropna().tolist()
+        if questions:
+            return questions
+    return [os.getenv("LOAD_TEST_QUESTION", "What are the main benefits of a data lake?")]
+
+def record_response(response, search_times, embedding_times, cache_hits):
+    # cache_hits counts questions answered from either backend cache. Result-cache hits skip the database,
+    # so they are left out of the server-side search time
+    if response.get("cache_hit") or response.get("embedding_cache"):
+        cache_hits.append(1)
+    if not response.get("cache_hit"):
+        search_times.append(response.get("search_time", 0.0))
+    embedding_times.append(response.get("embedding_time", 0.0))
+
+async def run_client(client_id, questions, batch_size, latencies, search_times, embedding_times, cache_hits, errors):
+    # Each request carries one question, or batch_size questions as a batch; latencies are per request
+    client_questions = [questions[(client_id * LOAD_TEST_REQUESTS + i) % len(questions)] for i in range(LOAD_TEST_REQUESTS)]
+    async with websockets.connect(LOAD_TEST_URL, max_size=None) as websocket:
+        for start in range(0, len(client_questions), batch_size):
+            if batch_size > 1:
+                message = {"questions": client_questions[start:start + batch_size], "top_n": LOAD_TEST_TOP_N, "no_cache": True}
+            else:
+                message = {"question": client_questions[start], "top_n": LOAD_TEST_TOP_N, "no_cache": True}
+            start_time = time.perf_counter()
+            await websocket.send(json.dumps(message))
+            response = json.loads(await websocket.recv())
+            latencies.append(time.perf_counter() - start_time)
+            if "error" in response:
+                errors.append(response["error"])
+            elif response.get("batch"):
+                for question_response in response["results"]:
+                    record_response(question_response, search_times, embedding_times, cache_hits)
+            else:
+                record_response(response, search_times, embedding_times, cache_hits)
+
+async def run_level(concurrency, questions, batch_size=1):
+    latencies, search_times, embedding_times, cache_hits, errors = [], [], [], [], []
+    start_time = time.perf_counter()
+    await asyncio.gather(*(run_client(i, questions, batch_size, latencies, search_times, embedding_times, cache_hits, errors)
+                           for i in range(concurrency)))
+    wall_time = time.perf_counter() - start_time
+    return {
+        'mode': 'batch' if batch_size > 1 else 'sequential',
+        'batch_size': batch_size,
+        'concurrency': concurrency,
+        'requests': len(latencies),
+        'errors': len(errors),
+        'cache_hits': len(cache_hits),
+        'wall_time': round(wall_time, 3),
+        'throughput_rps': round(len(latencies) / wall_time, 2) if wall_time > 0 else 0.0,
+        'questions_per_sec': round(concurrency * LOAD_TEST_REQUESTS / wall_time, 2) if wall_time > 0 else 0.0,
+        'latency_p50': round(float(np.percentile(latencies, 50)), 4) if latencies else None,
+        'latency_p95': round(float(np.percentile(latencies, 95)), 4) if latencies else None,
+        'search_time_mean': round(float(np.mean(search_times)), 4) if search_times else None,
+        'embedding_time_mean': round(float(np.mean(embedding_times)), 4) if embedding_times else None,
+        # Average number of requests in flight: ~concurrency when requests overlap, ~1 when they serialize
+        'overlap': round(sum(latencies) / wall_time, 2) if wall_time > 0 else 0.0,
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+
+async def main():
+    questions = load_questions()
+    results = []
+    batch_sizes = [1, LOAD_TEST_BATCH_SIZE] if LOAD_TEST_BATCH_SIZE > 1 else [1]
+    for batch_size in batch_sizes:
+        for concurrency in LOAD_TEST_CONCURRENCY:
+            result = await run_level(concurrency, questions, batch_size)
+            logger.info(f"{result['mode']} {concurrency} clients: {result['requests']} requests in {result['wall_time']}s "
+                        f"({result['questions_per_sec']} questions/sec), p50 {result['latency_p50']}s, "
+                        f"p95 {result['latency_p95']}s, overlap {result['overlap']}, {result['errors']} errors")
+            results.append(result)
+
+    cache_hits = sum(result['cache_hits'] for result in results)
+    if cache_hits:
+        raise RuntimeError(f"{cache_hits} responses were served from the backend's caches, so the runs are "
+                           f"not comparable; results not saved")
+
+    pd.DataFrame(results).to_csv(LOAD_TEST_OUTPUT_CSV, mode='a', header=not os.path.exists(LOAD_TEST_OUTPUT_CSV), index=False)
+    logger.info(f"Load test results appended to {LOAD_TEST_OUTPUT_CSV}")
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except Exception as e:
+        logger.error(f"Script execution failed: {e}")
+        exit(1)
@@ -0,0 +1,226 @@
+# pgvector-ann/backend/src/migrate_halfvec.py
+# Online migration of chunk tables from chunk_vector vector(3072) (indexed through a halfvec cast) to a native
+# halfvec(3072) column, recording table size, index size and search latency before and after.
+#
+# 1. add chunk_vector_half and backfill it in id batches, one short transaction per batch
+# 2. build the new index CONCURRENTLY on chunk_vector_half (per partition for partitioned tables, attached to an
+#    index created ON ONLY the parent, since CONCURRENTLY is not supported on a partitioned table itself)
+# 3. lock the table briefly: backfill rows written since step 1, drop the old cast index, rename
+#    chunk_vector -> chunk_vector_full (KEEP_FULL_VECTORS=true) or drop it, rename chunk_vector_half -> chunk_vector
+#
+# Set VECTOR_COLUMN_TYPE=halfvec for the loaders once the migration has finished.
+import os
+import time
+import logging
+import numpy as np
+import pandas as pd
+from datetime import datetime
+from config import *
+from csv_to_pgvector import get_db_connection, sanitize_table_name, get_index_name
+from utils.search_cache import bump_ingest_generation
+
+MIGRATE_TABLES = [t for t in os.getenv("MIGRATE_TABLES", "").split(",") if t]
+MIGRATE_BATCH_SIZE = int(os.getenv("MIGRATE_BATCH_SIZE", "10000"))
+MIGRATE_BENCHMARK_QUERIES = int(os.getenv("MIGRATE_BENCHMARK_QUERIES", "100"))
+MIGRATE_TOP_K = int(os.getenv("MIGRATE_TOP_K", "10"))
+# Dropping a column does not give its TOAST space back until the table is rewritten. VACUUM FULL does that
+# but holds an ACCESS EXCLUSIVE lock for the whole rewrite, so it is off by default.
+MIGRATE_VACUUM_FULL = os.getenv("MIGRATE_VACUUM_FULL", "false").lower() == "true"
+MIGRATE_OUTPUT_CSV = "/app/data/log/migrate_halfvec.csv"
+
+logging.basicConfig(filename="/app/data/log/migrate_halfvec.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+def get_vector_tables(cursor):
+    # Tables whose chunk_vector is still a full-precision vector column, including partitioned tables
+    # (TABLE_LAYOUT=partitioned). Partitions are skipped: their columns belong to the partitioned parent and
+    # cannot be dropped or renamed one partition at a time, so they are migrated through it.
+    cursor.execute("""
+    SELECT c.relname FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    JOIN pg_attribute a ON a.attrelid = c.oid
+    WHERE n.nspname = 'public' AND c.relkind IN ('r', 'p') AND NOT c.relispartition
+      AND a.attname = 'chunk_vector' AND NOT a.attisdropped
+      AND format_type(a.atttypid, a.atttypmod) = 'vector(3072)'
+    ORDER BY c.relname;
+    """)
+    return [row[0] for row in cursor.fetchall()]
+
+def get_partitions(cursor, table_name):
+    # Direct partitions of a partitioned table; empty for a plain table
+    cursor.execute("""
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass ORDER BY c.relname;
+    """, (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
+def set_search_params(cursor):
+    if INDEX_TYPE == "ivfflat":
+        cursor.execute(f"SET ivfflat.probes = {IVFFLAT_PROBES};")
+    elif INDEX_TYPE in ["hnsw", "hnsw_bq"]:
+        cursor.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH};")
+
+def sample_query_vectors(cursor, table_name):
+    cursor.execute(f"SELECT chunk_vector FROM {table_name} TABLESAMPLE SYSTEM (1) LIMIT %s;", (MIGRATE_BENCHMARK_QUERIES,))
+    vectors = [np.asarray(row[0], dtype=np.float32) for row in cursor.fetchall()]
+    if len(vectors) < MIGRATE_BENCHMARK_QUERIES:
+        cursor.execute(f"SELECT chunk_vector FROM {table_name} ORDER BY random() LIMIT %s;", (MIGRATE_BENCHMARK_QUERIES,))
+        vectors = [np.asarray(row[0], dtype=np.float32) for row in cursor.fetchall()]
+    return vectors
+
+def measure_table(conn, table_name, stage, query_vectors, distance_expression):
+    with conn.cursor() as cursor:
+        set_search_params(cursor)
+        # A partitioned table has no storage of its own, so sizes are summed over the partition tree
+        cursor.execute("""
+        SELECT COALESCE(SUM(pg_table_size(relid)), 0), COALESCE(SUM(pg_indexes_size(relid)), 0)
+        FROM pg_partition_tree(%s::regclass);
+        """, (table_name,))
+        table_size, index_size = cursor.fetchone()
+        latencies = []
+        for vector in query_vectors:
+            start_time = time.perf_counter()
+            cursor.execute(f"""
+            SELECT id, ({distance_expression}) AS distance FROM {table_name}
+            ORDER BY distance ASC LIMIT %s;
+            """, (vector, MIGRATE_TOP_K))
+            cursor.fetchall()
+            latencies.append((time.perf_counter() - start_time) * 1000)
+    conn.commit()
+    result = {
+        'table': table_name,
+        'stage': stage,
+        'index_type': INDEX_TYPE,
+        'table_size_mb': round(table_size / 1024 ** 2, 2),
+        'index_size_mb': round(index_size / 1024 ** 2, 2),
+        'queries': len(latencies),
+        'p50_ms': round(float(np.percentile(latencies, 50)), 2) if latencies else None,
+        'p95_ms': round(float(np.percentile(latencies, 95)), 2) if latencies else None,
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    logger.info(f"{table_name} ({stage}): table {result['table_size_mb']}MB, indexes {result['index_size_mb']}MB, "
+                f"p50 {result['p50_ms']}ms, p95 {result['p95_ms']}ms")
+    return result
+
+def backfill(conn, table_name):
+    with conn.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN IF NOT EXISTS chunk_vector_half halfvec(3072);")
+        conn.commit()
+        cursor.execute(f"SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM {table_name};")
+        min_id, max_id = cursor.fetchone()
+        updated = 0
+        for start in range(min_id, max_id + 1, MIGRATE_BATCH_SIZE):
+            cursor.execute(f"""
+            UPDATE {table_name} SET chunk_vector_half = chunk_vector::halfvec(3072)
+            WHERE id >= %s AND id < %s AND chunk_vector_half IS NULL;
+            """, (start, start + MIGRATE_BATCH_SIZE))
+            updated += cursor.rowcount
+            conn.commit()
+        logger.info(f"Backfilled chunk_vector_half for {updated} rows of {table_name}")
+
+def build_half_index(conn, table_name):
+    index_name = f"{INDEX_TYPE}_{table_name}_chunk_vector_half_idx"
+    if INDEX_TYPE == "hnsw":
+        options = f"USING hnsw (chunk_vector_half halfvec_ip_ops) WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})"
+    elif INDEX_TYPE == "hnsw_bq":
+        options = (f"USING hnsw ((binary_quantize(chunk_vector_half)::bit(3072)) bit_hamming_ops) "
+                   f"WITH (m = {HNSW_M}, ef_construction = {HNSW_EF_CONSTRUCTION})")
+    elif INDEX_TYPE == "ivfflat":
+        options = f"USING ivfflat (chunk_vector_half halfvec_ip_ops) WITH (lists = {IVFFLAT_LISTS})"
+    else:
+        return None
+    with conn.cursor() as cursor:
+        partitions = get_partitions(cursor, table_name)
+    conn.commit()
+    # CREATE INDEX CONCURRENTLY cannot run inside a transaction block
+    conn.autocommit = True
+    try:
+        start_time = time.perf_counter()
+        conn.execute("SELECT set_config('maintenance_work_mem', %s, false);", (MAINTENANCE_WORK_MEM,))
+        if partitions:
+            # The parent index stays invalid until every partition's index is attached to it
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON ONLY {table_name} {options};")
+            for partition in partitions:
+                partition_index_name = f"{INDEX_TYPE}_{partition}_chunk_vector_half_idx"
+                conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {partition_index_name} ON {partition} {options};")
+                conn.execute(f"ALTER INDEX {index_name} ATTACH PARTITION {partition_index_name};")
+                logger.info(f"Built {partition_index_name} concurrently")
+        else:
+            conn.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index_name} ON {table_name} {options};")
+        logger.info(f"Built {index_name} concurrently in {time.perf_counter() - start_time:.2f}s")
+    finally:
+        conn.autocommit = False
+    return index_name
+
+def swap_columns(conn, table_name, half_index_name):
+    with conn.cursor() as cursor:
+        cursor.execute(f"LOCK TABLE {table_name} IN ACCESS EXCLUSIVE MODE;")
+        cursor.execute(f"UPDATE {table_name} SET chunk_vector_half = chunk_vector::halfvec(3072) WHERE chunk_vector_half IS NULL;")
+        logger.info(f"Backfilled {cursor.rowcount} rows written to {table_name} during the migration")
+        cursor.execute("""
+        SELECT indexname FROM pg_indexes
+        WHERE schemaname = 'public' AND tablename = %s
+          AND (indexdef LIKE '%%(chunk_vector)::halfvec%%' OR indexdef LIKE '%%binary_quantize(chunk_vector)%%');
+        """, (table_name,))
+        for (index_name,) in cursor.fetchall():
+            cursor.execute(f"DROP INDEX {index_name};")
+            logger.info(f"Dropped index {index_name} on the old column")
+        if KEEP_FULL_VECTORS:
+            cursor.execute(f"ALTER TABLE {table_name} RENAME COLUMN chunk_vector TO chunk_vector_full;")
+        else:
+            cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN chunk_vector;")
+        cursor.execute(f"ALTER TABLE {table_name} RENAME COLUMN chunk_vector_half TO chunk_vector;")
+        if half_index_name:
+            cursor.execute(f"ALTER INDEX {half_index_name} RENAME TO {get_index_name(table_name)};")
+    conn.commit()
+    logger.info(f"Swapped {table_name}.chunk_vector to halfvec(3072) (full vectors kept: {KEEP_FULL_VECTORS})")
+
+def migrate_table(conn, table_name):
+    with conn.cursor() as cursor:
+        query_vectors = sample_query_vectors(cursor, table_name)
+    conn.commit()
+    results = [measure_table(conn, table_name, "before", query_vectors,
+                             "chunk_vector::halfvec(3072) <#> %s::halfvec(3072)")]
+
+    start_time = time.perf_counter()
+    backfill(conn, table_name)
+    half_index_name = build_half_index(conn, table_name)
+    swap_columns(conn, table_name, half_index_name)
+    if MIGRATE_VACUUM_FULL:
+        conn.autocommit = True
+        try:
+            conn.execute(f"VACUUM FULL {table_name};")
+        finally:
+            conn.autocommit = False
+    logger.info(f"Migrated {table_name} in {time.perf_counter() - start_time:.2f}s")
+
+    results.append(measure_table(conn, table_name, "after", query_vectors, "chunk_vector <#> %s::halfvec(3072)"))
+    return results
+
+def main():
+    results = []
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            tables = [sanitize_table_name(t) for t in MIGRATE_TABLES] or get_vector_tables(cursor)
+        conn.commit()
+        logger.info(f"Migrating {len(tables)} tables to halfvec(3072): {tables}")
+        for table_name in tables:
+            try:
+                results.extend(migrate_table(conn, table_name))
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error migrating {table_name}: {e}")
+        # halfvec distances differ slightly from the float32 ones cached by the backend
+        if results:
+            bump_ingest_generation(conn, "migrate_halfvec.py")
+
+    if results:
+        pd.DataFrame(results).to_csv(MIGRATE_OUTPUT_CSV, mode='a', header=not os.path.exists(MIGRATE_OUTPUT_CSV), index=False)
+        logger.info(f"Before/after comparison appended to {MIGRATE_OUTPUT_CSV}")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"Script execution failed: {e}")
+        exit(1)
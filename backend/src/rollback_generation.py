@@ -0,0 +1,37 @@
+# pgvector-ann/backend/src/rollback_generation.py
+# Point blue/green views back at their previous generation (see utils/table_generations.py).
+# ROLLBACK_TABLES: comma-separated base names; defaults to every table with a recorded generation.
+import os
+import logging
+from csv_to_pgvector import get_db_connection, sanitize_table_name
+from utils.table_generations import ensure_generations_table, rollback_generation
+from utils.search_cache import bump_ingest_generation
+from utils.row_counts import refresh_row_counts
+
+ROLLBACK_TABLES = [t for t in os.getenv("ROLLBACK_TABLES", "").split(",") if t]
+
+logging.basicConfig(filename="/app/data/log/rollback_generation.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+def main():
+    with get_db_connection() as conn:
+        with conn.cursor() as cursor:
+            ensure_generations_table(cursor)
+            cursor.execute("SELECT base_name FROM table_generations ORDER BY base_name;")
+            base_names = [sanitize_table_name(t) for t in ROLLBACK_TABLES] or [row[0] for row in cursor.fetchall()]
+        conn.commit()
+        for base_name in base_names:
+            try:
+                rollback_generation(conn, base_name)
+            except Exception as e:
+                conn.rollback()
+                logger.error(f"Error rolling back {base_name}: {e}")
+        refresh_row_counts(conn, base_names)
+        bump_ingest_generation(conn, "rollback_generation.py")
+
+if __name__ == "__main__":
+    try:
+        main()
+    except Exception as e:
+        logger.error(f"Script execution failed: {e}")
+        exit(1)
@@ -6,7 +6,8 @@ from datetime import datetime
 import os
 import csv
 import pandas as pd
-from config import INDEX_TYPE, PDF_INPUT_DIR, CSV_OUTPUT_DIR, PIPELINE_EXECUTION_MODE, ENABLE_ALL_CSV
+from config import INDEX_TYPE, INDEX_BUILD_MODE, PDF_INPUT_DIR, CSV_OUTPUT_DIR, PIPELINE_EXECUTION_MODE, ENABLE_ALL_CSV
+from utils.pipeline_summary import read_summary, clear_summary
 
 log_dir = "/app/data/log"
 os.makedirs(log_dir, exist_ok=True)
@@ -15,6 +16,7 @@ os.makedirs(CSV_OUTPUT_DIR, exist_ok=True)
 
 vectorizer_log = f"{log_dir}/vectorizer.log"
 csv_to_pgvector_log = f"{log_dir}/csv_to_pgvector.log"
+stream_pipeline_log = f"{log_dir}/stream_pipeline.log"
 run_pipeline_log = f"{log_dir}/run_pipeline.log"
 
 logging.basicConfig(filename=run_pipeline_log, level=logging.INFO, format='%(asctime)s - %(message)s')
@@ -47,7 +49,18 @@ def get_file_size(file_path):
     size_mb = size_bytes / (1024 * 1024)
     return f"{size_mb:.2f}MB"
 
-def append_to_csv(filename, index_type, num_of_rows, execution_time):
+def summarize_index_builds(summary):
+    # Total build time (s) and size (MB) of indexes built after loading (INDEX_BUILD_MODE=deferred)
+    index_builds = summary.get('index_builds', [])
+    if not index_builds:
+        return None, None
+    for build in index_builds:
+        logger.info(f"  - Index {build['index']}: built in {build['build_time']:.2f}s, {build['index_size'] / 1024 ** 2:.2f}MB")
+    build_time = sum(build['build_time'] for build in index_builds)
+    index_size = sum(build['index_size'] for build in index_builds) / (1024 * 1024)
+    return round(build_time, 2), round(index_size, 2)
+
+def append_to_csv(filename, index_type, num_of_rows, execution_time, index_build_time=None, index_size_mb=None):
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     new_row = pd.DataFrame({
@@ -56,6 +69,8 @@ def append_to_csv(filename, index_type, num_of_rows, execution_time):
         'index_type': [index_type],
         'num_of_rows': [num_of_rows],
         'execution_time': [round(execution_time, 2)],
+        'index_build_time': [index_build_time],
+        'index_size_mb': [index_size_mb],
         'timestamp': [timestamp]
     })
 
@@ -73,6 +88,7 @@ def append_to_csv(filename, index_type, num_of_rows, execution_time):
 def run_script(script_name):
     start_time = time.time()
     logger.info(f"Starting execution of {script_name}")
+    clear_summary(script_name)
 
     try:
         # Execute the script
@@ -95,19 +111,31 @@ def run_script(script_name):
             logger.info(f"  - Index type: {INDEX_TYPE.upper()}")
             logger.info(f"  - Rows inserted: {row_count}")
             logger.info(f"  - ENABLE_ALL_CSV: {ENABLE_ALL_CSV}")
-            append_to_csv(script_name, INDEX_TYPE.upper(), row_count, execution_time)
+            summary = read_summary(script_name)
+            logger.info(f"  - Peak RSS: {summary.get('peak_rss_mb', 0):.1f}MB")
+            index_build_time, index_size_mb = summarize_index_builds(summary)
+            append_to_csv(script_name, INDEX_TYPE.upper(), row_count, execution_time, index_build_time, index_size_mb)
         elif script_name == 'vectorizer.py':
             pdf_count = sum([len(files) for _, _, files in os.walk(PDF_INPUT_DIR) if any(f.endswith('.pdf') for f in files)])
-            csv_count = sum([len(files) for _, _, files in os.walk(CSV_OUTPUT_DIR) if any(f.endswith('.csv') for f in files)])
+            csv_count = sum([len([f for f in files if f.endswith('.csv')]) for _, _, files in os.walk(CSV_OUTPUT_DIR)])
             logger.info(f"  - PDFs processed: {pdf_count}")
             logger.info(f"  - CSV files generated: {csv_count}")
             append_to_csv(script_name, INDEX_TYPE.upper(), csv_count, execution_time)
+        elif script_name == 'stream_pipeline.py':
+            summary = read_summary(script_name)
+            row_count = summary.get('rows', 0)
+            logger.info(f"  - Index type: {INDEX_TYPE.upper()}")
+            logger.info(f"  - Files streamed: {summary.get('files', 0)}")
+            logger.info(f"  - Rows inserted: {row_count}")
+            logger.info(f"  - Peak RSS: {summary.get('peak_rss_mb', 0):.1f}MB")
+            index_build_time, index_size_mb = summarize_index_builds(summary)
+            append_to_csv(script_name, INDEX_TYPE.upper(), row_count, execution_time, index_build_time, index_size_mb)
 
     except Exception as e:
         logger.error(f"Unexpected error occurred while running {script_name}: {e}")
 
 def combine_logs():
-    log_files = [vectorizer_log, csv_to_pgvector_log, run_pipeline_log]
+    log_files = [vectorizer_log, csv_to_pgvector_log, stream_pipeline_log, run_pipeline_log]
     combined_log = f"{log_dir}/combined_pipeline.log"
 
     with open(combined_log, 'w') as outfile:
@@ -127,7 +155,7 @@ def combine_logs():
 
 def main():
     logger.info("Starting pipeline execution")
-    logger.info(f"Using index type: {INDEX_TYPE.upper()}")
+    logger.info(f"Using index type: {INDEX_TYPE.upper()} (build mode: {INDEX_BUILD_MODE})")
     logger.info(f"ENABLE_ALL_CSV: {ENABLE_ALL_CSV}")
     logger.info(f"PIPELINE_EXECUTION_MODE: {PIPELINE_EXECUTION_MODE}")
 
@@ -136,6 +164,8 @@ def main():
         run_script('csv_to_pgvector.py')
     elif PIPELINE_EXECUTION_MODE == "csv_to_pgvector":
         run_script('csv_to_pgvector.py')
+    elif PIPELINE_EXECUTION_MODE == "stream":
+        run_script('stream_pipeline.py')
     else:
         logger.error(f"Invalid PIPELINE_EXECUTION_MODE: {PIPELINE_EXECUTION_MODE}")
         return
@@ -0,0 +1,331 @@
+# pgvector-ann/backend/src/stream_pipeline.py
+import os
+import queue
+import threading
+import time
+import logging
+import pandas as pd
+from datetime import datetime, timezone
+from config import *
+from vectorizer import (
+    get_pdf_files_from_local, get_output_csv_path, count_tokens, embed_chunks, extract_pdf_files, log_embedding_cache_stats
+)
+from csv_to_pgvector import (
+    get_db_connection, sanitize_table_name, get_category_table, prepare_table, build_index, copy_rows, compute_content_hash,
+    get_peak_rss_mb
+)
+from utils.manifest import load_manifest, save_manifest, diff_pdf_files, get_manifest_settings, compute_sha256
+from utils.pipeline_summary import write_summary
+from utils.search_cache import bump_ingest_generation
+from utils.row_counts import refresh_row_counts
+from utils.table_generations import check_not_generation_view
+from utils.vector_store import VectorTableWriter, remove_vector_table
+
+# vectorizer / csv_to_pgvector configure logging on import; this script logs to its own file
+logging.basicConfig(filename="/app/data/log/stream_pipeline.log", level=logging.INFO, format='%(asctime)s - %(message)s', force=True)
+logger = logging.getLogger(__name__)
+
+# Chunks per message between stages: enough for every concurrent embedding request to get a full batch
+STREAM_UNIT_SIZE = EMBEDDING_BATCH_SIZE * EMBEDDING_CONCURRENCY
+
+class StreamContext:
+    def __init__(self):
+        self.abort = threading.Event()
+        self.error = None
+
+    def fail(self, stage, error):
+        logger.error(f"{stage} stage failed: {error}")
+        logger.exception("Full traceback:")
+        if self.error is None:
+            self.error = error
+        self.abort.set()
+
+    def put(self, q, item):
+        while not self.abort.is_set():
+            try:
+                q.put(item, timeout=1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def get(self, q):
+        while not self.abort.is_set():
+            try:
+                return q.get(timeout=1)
+            except queue.Empty:
+                continue
+        return None
+
+def get_category(file_path):
+    if ENABLE_ALL_CSV and TABLE_LAYOUT != "partitioned":
+        return sanitize_table_name("all_data")
+    relative_path = os.path.relpath(file_path, PDF_INPUT_DIR)
+    parts = relative_path.split(os.sep)
+    if len(parts) < 2:
+        return None  # same as the CSV path: only files inside a category directory are loaded
+    return sanitize_table_name(parts[0])
+
+def extract_stage(files, embed_queue, ctx):
+    # PDF -> chunk records, split into units of STREAM_UNIT_SIZE chunks
+    try:
+        for file_path, pages in extract_pdf_files(files):
+            if ctx.abort.is_set():
+                return
+            if not pages:
+                logger.warning(f"No text extracted from PDF file: {file_path}")
+                ctx.put(embed_queue, ("file_failed", file_path, None))
+                continue
+
+            ctx.put(embed_queue, ("file_start", file_path, None))
+            unit = []
+            chunk_no = 0
+            for page in pages:
+                for chunk in page["chunks"]:
+                    chunk_no += 1
+                    unit.append({
+                        'file_name': file_path,
+                        'document_page': str(page["page"]),
+                        'chunk_no': chunk_no,
+                        'chunk_text': chunk,
+                        'token_count': count_tokens(chunk)
+                    })
+                    if len(unit) >= STREAM_UNIT_SIZE:
+                        ctx.put(embed_queue, ("rows", file_path, unit))
+                        unit = []
+            if unit:
+                ctx.put(embed_queue, ("rows", file_path, unit))
+            ctx.put(embed_queue, ("file_end", file_path, chunk_no))
+    except Exception as e:
+        ctx.fail("Extract", e)
+    finally:
+        ctx.put(embed_queue, None)
+
+def embed_stage(embed_queue, write_queue, ctx):
+    # Embeds "rows" messages; file markers pass through in order
+    try:
+        while True:
+            message = ctx.get(embed_queue)
+            if message is None:
+                break
+            kind, file_path, records = message
+            if kind == "rows":
+                message = (kind, file_path, (records, embed_chunks(records)))
+            ctx.put(write_queue, message)
+    except Exception as e:
+        ctx.fail("Embed", e)
+    finally:
+        ctx.put(write_queue, None)
+
+class StreamWriter:
+    def __init__(self, conn, manifest):
+        self.conn = conn
+        self.manifest = manifest
+        self.tables = set()
+        self.rows_written = 0
+        self.files_written = 0
+        # Tables changed since the last publish; see publish()
+        self.unpublished_tables = set()
+        self.published_at = time.monotonic()
+        self.current_table = None
+        self.current_category = None
+        self.csv_writer = None
+
+    def ensure_table(self, cursor, category):
+        table_name = get_category_table(category)
+        if table_name not in self.tables:
+            # A table that blue/green ingest turned into a view is only loaded through csv_to_pgvector
+            check_not_generation_view(cursor, DOCUMENT_TABLE_NAME if TABLE_LAYOUT == "partitioned" else table_name)
+            prepare_table(cursor, category)
+            self.conn.commit()
+            self.tables.add(table_name)
+
+    def delete_file_rows(self, cursor, table_name, file_path):
+        cursor.execute("SELECT to_regclass(%s);", (table_name,))
+        if cursor.fetchone()[0] is not None:
+            cursor.execute(f"DELETE FROM {table_name} WHERE file_name = %s;", (file_path,))
+            if cursor.rowcount:
+                logger.info(f"Deleted {cursor.rowcount} previous rows of {file_path} from {table_name}")
+                self.unpublished_tables.add(table_name)
+
+    def file_start(self, file_path):
+        self.current_category = get_category(file_path)
+        self.current_table = get_category_table(self.current_category) if self.current_category else None
+        self.csv_writer = VectorTableWriter(get_output_csv_path(file_path)) if ENABLE_STREAM_CSV_SINK else None
+        if self.current_table is None:
+            logger.warning(f"Skipping {file_path}: not inside a category directory")
+            return
+        with self.conn.cursor() as cursor:
+            self.ensure_table(cursor, self.current_category)
+            self.delete_file_rows(cursor, self.current_table, file_path)
+        self.conn.commit()
+
+    def write_rows(self, records, vectors):
+        if self.current_table is None:
+            return
+        now = datetime.now(timezone.utc)
+        current_time = now.strftime('%Y-%m-%d %H:%M:%S %Z')
+        rows = ((
+            record['file_name'], int(record['document_page']), record['chunk_no'], record['chunk_text'],
+            record['model'], record['prompt_tokens'], record['total_tokens'], now,
+            vector, self.current_category, compute_content_hash(record['chunk_text'], vector)
+        ) for record, vector in zip(records, vectors))
+        with self.conn.cursor() as cursor:
+            self.rows_written += copy_rows(cursor, self.current_table, rows)
+        self.conn.commit()
+        self.unpublished_tables.add(self.current_table)
+
+        if self.csv_writer:
+            self.csv_writer.write(pd.DataFrame({
+                'file_name': [record['file_name'] for record in records],
+                'document_page': [record['document_page'] for record in records],
+                'chunk_no': [record['chunk_no'] for record in records],
+                'chunk_text': [record['chunk_text'] for record in records],
+                'model': [record['model'] for record in records],
+                'prompt_tokens': [record['prompt_tokens'] for record in records],
+                'total_tokens': [record['total_tokens'] for record in records],
+                'created_date_time': current_time
+            }), vectors)
+
+    def file_end(self, file_path, rows):
+        # Only completed files are recorded, so an interrupted file is redone (after deleting its rows) next run
+        relative_path = os.path.relpath(file_path, PDF_INPUT_DIR)
+        output = None
+        if self.csv_writer:
+            if self.current_table and self.csv_writer.close():
+                output = self.csv_writer.path
+            else:
+                remove_vector_table(self.csv_writer.path)
+        stat = os.stat(file_path)
+        self.manifest['files'][relative_path] = {
+            'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': compute_sha256(file_path),
+            'output': output,
+            'rows': rows if self.current_table else 0, 'table': self.current_table
+        }
+        save_manifest(self.manifest, STREAM_MANIFEST_PATH)
+        self.files_written += 1
+        logger.info(f"Streamed {file_path}: {rows} rows into {self.current_table}")
+        self.publish()
+
+    def publish(self, force=False):
+        # Rows are searchable as soon as they are committed, so row counts and the ingest generation follow the
+        # run instead of waiting for its end; at most every STREAM_PUBLISH_INTERVAL seconds, since each publish
+        # re-counts the changed tables and drops the backend's search-result cache
+        if not self.unpublished_tables:
+            return
+        if not force and time.monotonic() - self.published_at < STREAM_PUBLISH_INTERVAL:
+            return
+        # Partitions are counted through their parent, which is what the backend searches
+        tables = [DOCUMENT_TABLE_NAME] if TABLE_LAYOUT == "partitioned" else sorted(self.unpublished_tables)
+        refresh_row_counts(self.conn, tables)
+        bump_ingest_generation(self.conn, "stream_pipeline.py")
+        self.unpublished_tables.clear()
+        self.published_at = time.monotonic()
+
+def write_stage(write_queue, writer, ctx):
+    try:
+        while True:
+            message = ctx.get(write_queue)
+            if message is None:
+                break
+            kind, file_path, payload = message
+            if kind == "file_start":
+                writer.file_start(file_path)
+            elif kind == "rows":
+                writer.write_rows(*payload)
+            elif kind == "file_end":
+                writer.file_end(file_path, payload)
+    except Exception as e:
+        writer.conn.rollback()
+        ctx.fail("Write", e)
+
+def remove_deleted_files(conn, manifest, deleted):
+    # Returns the tables rows were deleted from
+    tables = set()
+    with conn.cursor() as cursor:
+        for relative_path in deleted:
+            entry = manifest['files'].pop(relative_path, None) or {}
+            file_path = os.path.join(PDF_INPUT_DIR, relative_path)
+            category = get_category(file_path)
+            table_name = entry.get('table') or (get_category_table(category) if category else None)
+            if table_name:
+                cursor.execute("SELECT to_regclass(%s);", (table_name,))
+                if cursor.fetchone()[0] is not None:
+                    cursor.execute(f"DELETE FROM {table_name} WHERE file_name = %s;", (file_path,))
+                    logger.info(f"Deleted {cursor.rowcount} rows of removed PDF {file_path} from {table_name}")
+                    tables.add(table_name)
+            if entry.get('output'):
+                remove_vector_table(entry['output'])
+    conn.commit()
+    return tables
+
+def run_stream_pipeline():
+    if ENABLE_BLUE_GREEN:
+        # The stream pipeline updates live tables file by file; blue/green rebuilds go through csv_to_pgvector
+        raise ValueError("ENABLE_BLUE_GREEN is not supported with PIPELINE_EXECUTION_MODE=stream")
+    start_time = time.time()
+    manifest = load_manifest(STREAM_MANIFEST_PATH)
+    pdf_files = get_pdf_files_from_local()
+    changed, deleted, rebuild = diff_pdf_files(pdf_files, manifest)
+    logger.info(f"Stream pipeline: {len(changed)} new or changed, {len(deleted)} deleted PDF files "
+                f"(full rebuild: {rebuild}, CSV sink: {ENABLE_STREAM_CSV_SINK}, queue size: {STREAM_QUEUE_SIZE})")
+
+    ctx = StreamContext()
+    embed_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+    write_queue = queue.Queue(maxsize=STREAM_QUEUE_SIZE)
+
+    with get_db_connection() as conn:
+        writer = StreamWriter(conn, manifest)
+        writer.unpublished_tables |= remove_deleted_files(conn, manifest, deleted)
+        if rebuild:
+            manifest['files'] = {}
+        manifest['settings'] = get_manifest_settings()
+        save_manifest(manifest, STREAM_MANIFEST_PATH)
+        writer.publish(force=True)
+
+        threads = [
+            threading.Thread(target=extract_stage, args=(changed, embed_queue, ctx), name="extract"),
+            threading.Thread(target=embed_stage, args=(embed_queue, write_queue, ctx), name="embed"),
+        ]
+        for thread in threads:
+            thread.start()
+        index_builds = []
+        try:
+            write_stage(write_queue, writer, ctx)
+            for thread in threads:
+                thread.join()
+
+            if INDEX_BUILD_MODE == "deferred" and ctx.error is None:
+                for table_name in sorted(writer.tables):
+                    index_build = build_index(conn, table_name)
+                    if index_build:
+                        index_builds.append(index_build)
+        finally:
+            # Also after a failed run: the files committed before the failure are already searchable
+            conn.rollback()
+            writer.publish(force=True)
+
+    elapsed = time.time() - start_time
+    # Includes the extraction pool workers, same as csv_to_pgvector
+    peak_rss_mb = get_peak_rss_mb()
+    rows_per_sec = writer.rows_written / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Stream pipeline finished: {writer.files_written} files, {writer.rows_written} rows in {elapsed:.2f}s "
+                f"({rows_per_sec:.2f} rows/sec), peak RSS {peak_rss_mb:.1f}MB")
+    log_embedding_cache_stats()
+    write_summary("stream_pipeline.py", {
+        'rows': writer.rows_written,
+        'files': writer.files_written,
+        'execution_time': elapsed,
+        'peak_rss_mb': peak_rss_mb,
+        'index_builds': index_builds
+    })
+
+    if ctx.error is not None:
+        raise ctx.error
+
+if __name__ == "__main__":
+    try:
+        run_stream_pipeline()
+    except Exception as e:
+        logger.error(f"Script execution failed: {e}")
+        exit(1)
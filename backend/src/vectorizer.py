@@ -1,27 +1,48 @@
 # pgvector-ann/backend/src/vectorizer.py
 import os
+import numpy as np
 import pandas as pd
-from pypdf import PdfReader
-from openai import AzureOpenAI, OpenAI
 import logging
+import time
+import asyncio
+import tiktoken
 from config import *
-from langchain_text_splitters import CharacterTextSplitter
 from datetime import datetime, timezone
+from utils.embedding_scheduler import run_embedding_batches, split_usage
+from utils.embedding_cache import EmbeddingCache
+from utils.vector_store import (
+    VectorTableWriter, EmbeddingMatrix, write_vector_table, remove_vector_table, iter_vector_table, decode_embedding
+)
+from utils.pdf_extraction import extract_pdf_files, extract_page_range, get_page_count
+from utils.manifest import (
+    EMBEDDING_MODEL, get_manifest_settings, load_manifest, save_manifest, compute_sha256, diff_pdf_files, begin_manifest_update
+)
 
 logging.basicConfig(filename="/app/data/log/vectorizer.log", level=logging.INFO, format='%(asctime)s - %(message)s')
 logger = logging.getLogger(__name__)
 logger.info("Initializing vectorizer to read from local PDF folder")
 
-if ENABLE_OPENAI:
-    client = OpenAI(api_key=OPENAI_API_KEY)
-    logger.info("Using OpenAI API for embeddings")
-else:
-    client = AzureOpenAI(
-        azure_endpoint=AZURE_OPENAI_ENDPOINT,
-        api_key=AZURE_OPENAI_API_KEY,
-        api_version=AZURE_OPENAI_API_VERSION
-    )
-    logger.info("Using Azure OpenAI API for embeddings")
+# Both are created on first use: tiktoken downloads its BPE file the first time and the cache opens a SQLite
+# file, neither of which importers that only extract or count should depend on
+encoding = None
+embedding_cache = None
+
+def get_encoding():
+    global encoding
+    if encoding is None:
+        encoding = tiktoken.get_encoding("cl100k_base")
+    return encoding
+
+def get_embedding_cache():
+    global embedding_cache
+    if embedding_cache is None and ENABLE_EMBEDDING_CACHE:
+        embedding_cache = EmbeddingCache(EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_MAX_BYTES)
+    return embedding_cache
+
+def log_embedding_cache_stats():
+    # Only a cache this process actually opened has stats
+    if embedding_cache is not None:
+        embedding_cache.log_stats()
 
 def get_pdf_files_from_local():
     pdf_files = []
@@ -33,106 +54,215 @@ def get_pdf_files_from_local():
     return pdf_files
 
 def extract_text_from_pdf(file_path):
+    # Serial extraction of one PDF; process_pdf_files fans out through extract_pdf_files instead
     try:
-        with open(file_path, 'rb') as file:
-            pdf = PdfReader(file)
-            return [{"page_content": page.extract_text(), "metadata": {"page": i + 1}} for i, page in enumerate(pdf.pages)]
+        return extract_page_range(file_path, 0, get_page_count(file_path))["pages"]
     except Exception as e:
         logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
         return []
 
-def create_embedding(text):
-    if ENABLE_OPENAI:
-        response = client.embeddings.create(
-            input=text,
-            model="text-embedding-3-large"
-        )
-    else:
-        response = client.embeddings.create(
-            input=text,
-            model=AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT
-        )
-    return response
-
-def split_text_into_chunks(text):
-    text_splitter = CharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
-        separator=SEPARATOR
-    )
-    chunks = text_splitter.split_text(text)
-    return chunks if chunks else [text]
+def count_tokens(text):
+    return len(get_encoding().encode(text))
+
+def build_embedding_batches(chunks):
+    # Pack chunks into requests capped by EMBEDDING_BATCH_SIZE inputs and EMBEDDING_BATCH_MAX_TOKENS tokens
+    batch = []
+    batch_tokens = 0
+    for chunk in chunks:
+        if batch and (len(batch) >= EMBEDDING_BATCH_SIZE or batch_tokens + chunk['token_count'] > EMBEDDING_BATCH_MAX_TOKENS):
+            yield batch
+            batch = []
+            batch_tokens = 0
+        batch.append(chunk)
+        batch_tokens += chunk['token_count']
+    if batch:
+        yield batch
+
+def embed_chunks(chunks):
+    # Embed chunk records in concurrent batches. Model and token usage are attached to each record;
+    # the vectors are returned as a float32 matrix aligned with chunks.
+    # Chunks already in the embedding cache are filled in directly and never sent to the API.
+    vectors = EmbeddingMatrix(len(chunks))
+    pending = list(range(len(chunks)))
+    cache = get_embedding_cache()
+    if cache:
+        cached = cache.get_many(EMBEDDING_MODEL, [chunk['chunk_text'] for chunk in chunks])
+        pending = []
+        for i, (chunk, entry) in enumerate(zip(chunks, cached)):
+            if entry:
+                chunk.update({key: entry[key] for key in ('model', 'prompt_tokens', 'total_tokens')})
+                vectors.set(i, entry['chunk_vector'])
+            else:
+                pending.append(i)
+
+    batches = list(build_embedding_batches([chunks[i] for i in pending]))
+    responses = asyncio.run(run_embedding_batches(
+        EMBEDDING_MODEL,
+        [([chunk['chunk_text'] for chunk in batch], sum(chunk['token_count'] for chunk in batch)) for batch in batches]
+    )) if batches else []
+
+    offset = 0
+    for batch, response in zip(batches, responses):
+        embeddings = sorted(response.data, key=lambda item: item.index)
+        if len(embeddings) != len(batch):
+            raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+
+        weights = [chunk['token_count'] for chunk in batch]
+        prompt_tokens = split_usage(response.usage.prompt_tokens, weights)
+        total_tokens = split_usage(response.usage.total_tokens, weights)
+        for j, (chunk, item, prompt, total) in enumerate(zip(batch, embeddings, prompt_tokens, total_tokens)):
+            chunk['model'] = response.model
+            chunk['prompt_tokens'] = prompt
+            chunk['total_tokens'] = total
+            vectors.set(pending[offset + j], decode_embedding(item.embedding))
+        offset += len(batch)
+
+    vectors = vectors.array
+    if cache:
+        cache.put_many(EMBEDDING_MODEL, [
+            (chunks[i]['chunk_text'], {
+                'model': chunks[i]['model'],
+                'prompt_tokens': chunks[i]['prompt_tokens'],
+                'total_tokens': chunks[i]['total_tokens'],
+                'chunk_vector': vectors[i]
+            })
+            for i in pending
+        ])
+    return vectors
 
 def get_file_size(file_path):
     size_bytes = os.path.getsize(file_path)
     size_mb = size_bytes / (1024 * 1024)
     return f"{size_mb:.2f}MB"
 
-def process_pdf(file_name):
+def process_pdf(file_name, pages=None):
+    # pages: pre-extracted [{"page": n, "chunks": [...]}] in page order, extracted here if not given
     file_path = os.path.join(PDF_INPUT_DIR, file_name)
-    pages = extract_text_from_pdf(file_path)
+    if pages is None:
+        pages = extract_text_from_pdf(file_path)
     if not pages:
         logger.warning(f"No text extracted from PDF file: {file_name}")
-        return None
+        return None, None
 
-    processed_data = []
+    # chunk_no is assigned here, after extraction, so numbering is independent of how pages were split across workers
+    chunk_records = []
     total_chunks = 0
     for page in pages:
-        page_text = page["page_content"]
-        page_num = page["metadata"]["page"]
-        chunks = split_text_into_chunks(page_text)
-
-        if not chunks and page_text:
-            chunks = [page_text]
-
-        for chunk in chunks:
-            if chunk.strip():  # Only process non-empty chunks
-                response = create_embedding(chunk)
-                current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')
-                total_chunks += 1
-                processed_data.append({
-                    'file_name': file_name,
-                    'document_page': str(page_num),
-                    'chunk_no': total_chunks,
-                    'chunk_text': chunk,
-                    'model': response.model,
-                    'prompt_tokens': response.usage.prompt_tokens,
-                    'total_tokens': response.usage.total_tokens,
-                    'created_date_time': current_time,
-                    'chunk_vector': response.data[0].embedding
-                })
-
-    logger.info(f"Processed {file_name}: {len(pages)} pages, {total_chunks} chunks")
-    return pd.DataFrame(processed_data)
+        for chunk in page["chunks"]:
+            total_chunks += 1
+            chunk_records.append({
+                'file_name': file_name,
+                'document_page': str(page["page"]),
+                'chunk_no': total_chunks,
+                'chunk_text': chunk,
+                'token_count': count_tokens(chunk)
+            })
+
+    start_time = time.time()
+    vectors = embed_chunks(chunk_records)
+    elapsed = time.time() - start_time
+    current_time = datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S %Z')
+
+    processed_data = pd.DataFrame({
+        'file_name': file_name,
+        'document_page': [record['document_page'] for record in chunk_records],
+        'chunk_no': np.arange(1, total_chunks + 1, dtype=np.int32),
+        'chunk_text': [record['chunk_text'] for record in chunk_records],
+        'model': [record['model'] for record in chunk_records],
+        'prompt_tokens': np.array([record['prompt_tokens'] for record in chunk_records], dtype=np.int32),
+        'total_tokens': np.array([record['total_tokens'] for record in chunk_records], dtype=np.int32),
+        'created_date_time': current_time
+    })
+
+    throughput = total_chunks / elapsed if elapsed > 0 else 0.0
+    logger.info(f"Processed {file_name}: {len(pages)} pages, {total_chunks} chunks, "
+                f"embedding time {elapsed:.2f}s ({throughput:.2f} chunks/sec)")
+    return processed_data, vectors
+
+def get_output_csv_path(file_path):
+    relative_path = os.path.relpath(file_path, PDF_INPUT_DIR)
+    csv_file_name = f'{os.path.splitext(os.path.basename(file_path))[0]}.csv'
+    return os.path.join(CSV_OUTPUT_DIR, os.path.dirname(relative_path), csv_file_name)
+
+def patch_all_csv(removed_file_names, new_outputs):
+    # Rewrite all.csv as (existing rows - rows of removed/changed PDFs) + rows of the new per-file outputs.
+    # Both sides are streamed in BATCH_SIZE chunks, so memory does not grow with the corpus.
+    all_csv_path = os.path.join(CSV_OUTPUT_DIR, "all", "all.csv")
+    writer = VectorTableWriter(all_csv_path)
+    kept_rows = 0
+
+    try:
+        if os.path.exists(all_csv_path):
+            for meta, vectors in iter_vector_table(all_csv_path, BATCH_SIZE):
+                keep = ~meta['file_name'].isin(removed_file_names).to_numpy()
+                if not keep.any():
+                    continue
+                writer.write(meta[keep], [vector for vector, k in zip(vectors, keep) if k])
+                kept_rows += int(keep.sum())
+
+        for output_file in new_outputs:
+            for meta, vectors in iter_vector_table(output_file, BATCH_SIZE):
+                writer.write(meta, vectors)
+        total_rows = writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+    if total_rows:
+        logger.info(f"all.csv patched: {kept_rows} rows kept, {total_rows - kept_rows} rows added")
+    elif os.path.exists(all_csv_path):
+        remove_vector_table(all_csv_path)
+        logger.warning("No data left. all.csv was removed.")
+    else:
+        logger.warning("No data processed. all.csv was not created.")
 
 def process_pdf_files():
-    all_data = []
-    for file_path in get_pdf_files_from_local():
-        processed_data = process_pdf(file_path)
-        if processed_data is not None and not processed_data.empty:
-            relative_path = os.path.relpath(file_path, PDF_INPUT_DIR)
-            output_dir = os.path.join(CSV_OUTPUT_DIR, os.path.dirname(relative_path))
-            os.makedirs(output_dir, exist_ok=True)
+    manifest = load_manifest()
+    pdf_files = get_pdf_files_from_local()
+    changed, deleted, rebuild = diff_pdf_files(pdf_files, manifest)
+    logger.info(f"Manifest diff: {len(changed)} new or changed, {len(deleted)} deleted, "
+                f"{len(pdf_files) - len(changed)} unchanged PDF files (full rebuild: {rebuild})")
+
+    manifest, removed_file_names = begin_manifest_update(manifest, deleted, rebuild)
+    if rebuild:
+        all_csv_path = os.path.join(CSV_OUTPUT_DIR, "all", "all.csv")
+        remove_vector_table(all_csv_path)
 
-            csv_file_name = f'{os.path.splitext(os.path.basename(file_path))[0]}.csv'
-            output_file = os.path.join(output_dir, csv_file_name)
+    new_outputs = []
+    for file_path, pages in extract_pdf_files(changed):
+        relative_path = os.path.relpath(file_path, PDF_INPUT_DIR)
+        if pages is None:
+            # Extraction failed (including a crashed worker): keep the previous entry and output, so the file
+            # still counts as changed next run and its existing rows stay in all.csv until then
+            logger.error(f"Extraction failed for {file_path}, keeping its previous output")
+            continue
+        removed_file_names.add(file_path)
+        output_file = get_output_csv_path(file_path)
+        stat = os.stat(file_path)
+        entry = {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': compute_sha256(file_path), 'output': None, 'rows': 0}
 
-            processed_data.to_csv(output_file, index=False)
-            logger.info(f"CSV output completed for {csv_file_name}")
+        processed_data, vectors = process_pdf(file_path, pages)
+        if processed_data is not None and not processed_data.empty:
+            write_vector_table(processed_data, output_file, vectors)
+            logger.info(f"CSV output completed for {os.path.basename(output_file)} ({VECTOR_STORAGE_FORMAT})")
 
-            all_data.append(processed_data)
+            entry['output'] = output_file
+            entry['rows'] = len(processed_data)
+            new_outputs.append(output_file)
         else:
+            remove_vector_table(output_file)
+            entry['status'] = 'empty'
             logger.warning(f"No data processed for {file_path}")
+        manifest['files'][relative_path] = entry
 
-    # Combine all processed data into a single DataFrame
-    if all_data:
-        combined_data = pd.concat(all_data, ignore_index=True)
-
-        os.makedirs(os.path.dirname("/app/data/csv/all/all.csv"), exist_ok=True)
-        combined_data.to_csv("/app/data/csv/all/all.csv", index=False)
-        logger.info("CSV output completed for all.csv")
+    if changed or deleted or not os.path.exists(os.path.join(CSV_OUTPUT_DIR, "all", "all.csv")):
+        patch_all_csv(removed_file_names, new_outputs)
     else:
-        logger.warning("No data processed. all.csv was not created.")
+        logger.info("No PDF changes detected. all.csv left as is.")
+
+    manifest['settings'] = get_manifest_settings()
+    save_manifest(manifest)
+    log_embedding_cache_stats()
 
 if __name__ == "__main__":
     process_pdf_files()
@@ -0,0 +1,7 @@
+# pgvector-ann/backend/tests/conftest.py
+# The backend modules import config, which expects to run from the backend directory with the .env loaded
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("ENABLE_OPENAI", "true")
@@ -0,0 +1,68 @@
+# pgvector-ann/backend/tests/test_manifest.py
+import os
+import pandas as pd
+from utils import manifest as manifest_utils
+from utils.vector_store import write_vector_table, get_vector_path
+
+def write_pdf(path, content=b"%PDF-1.4"):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+
+def write_output(path):
+    df = pd.DataFrame({'file_name': ['x'], 'document_page': ['1'], 'chunk_no': [1], 'chunk_text': ['text']})
+    write_vector_table(df, path, [[0.1, 0.2]])
+
+def make_entry(pdf_path, output):
+    stat = os.stat(pdf_path)
+    return {'size': stat.st_size, 'mtime': stat.st_mtime, 'sha256': manifest_utils.compute_sha256(pdf_path),
+            'output': output, 'rows': 1}
+
+def test_deleted_pdf_output_is_removed_on_full_rebuild(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdf"
+    csv_dir = tmp_path / "csv"
+    monkeypatch.setattr(manifest_utils, "PDF_INPUT_DIR", str(pdf_dir))
+    monkeypatch.setattr(manifest_utils, "VECTORIZER_FULL_REBUILD", True)
+
+    kept_pdf = str(pdf_dir / "cat" / "kept.pdf")
+    deleted_pdf = str(pdf_dir / "cat" / "deleted.pdf")
+    kept_output = str(csv_dir / "cat" / "kept.csv")
+    deleted_output = str(csv_dir / "cat" / "deleted.csv")
+    for pdf_path, output in ((kept_pdf, kept_output), (deleted_pdf, deleted_output)):
+        write_pdf(pdf_path)
+        write_output(output)
+    manifest = {'settings': manifest_utils.get_manifest_settings(), 'files': {
+        os.path.join("cat", "kept.pdf"): make_entry(kept_pdf, kept_output),
+        os.path.join("cat", "deleted.pdf"): make_entry(deleted_pdf, deleted_output)
+    }}
+    os.remove(deleted_pdf)
+
+    changed, deleted, rebuild = manifest_utils.diff_pdf_files([kept_pdf], manifest)
+    assert rebuild
+    assert changed == [kept_pdf]
+    assert deleted == [os.path.join("cat", "deleted.pdf")]
+
+    manifest, removed_file_names = manifest_utils.begin_manifest_update(manifest, deleted, rebuild)
+    assert manifest['files'] == {}
+    assert removed_file_names == {deleted_pdf}
+    assert not os.path.exists(deleted_output)
+    assert not os.path.exists(get_vector_path(deleted_output))
+    assert os.path.exists(kept_output)
+
+def test_deleted_pdf_output_is_removed_without_rebuild(tmp_path, monkeypatch):
+    pdf_dir = tmp_path / "pdf"
+    monkeypatch.setattr(manifest_utils, "PDF_INPUT_DIR", str(pdf_dir))
+    monkeypatch.setattr(manifest_utils, "VECTORIZER_FULL_REBUILD", False)
+
+    deleted_output = str(tmp_path / "csv" / "cat" / "deleted.csv")
+    write_output(deleted_output)
+    manifest = {'settings': manifest_utils.get_manifest_settings(), 'files': {
+        os.path.join("cat", "deleted.pdf"): {'size': 1, 'mtime': 0.0, 'sha256': '', 'output': deleted_output, 'rows': 1}
+    }}
+
+    changed, deleted, rebuild = manifest_utils.diff_pdf_files([], manifest)
+    manifest, removed_file_names = manifest_utils.begin_manifest_update(manifest, deleted, rebuild)
+    assert not rebuild
+    assert manifest['files'] == {}
+    assert removed_file_names == {str(pdf_dir / "cat" / "deleted.pdf")}
+    assert not os.path.exists(deleted_output)
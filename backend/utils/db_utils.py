@@ -1,32 +1,137 @@
 # pgvector-ann/backend/utils/db_utils.py
 import psycopg
-from contextlib import contextmanager
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from psycopg_pool import AsyncConnectionPool
 import logging
+import numpy as np
 from config import *
 
 logger = logging.getLogger(__name__)
 
+pool = None
+
+def get_connection_kwargs():
+    return {
+        'dbname': PGVECTOR_DB_NAME,
+        'user': PGVECTOR_DB_USER,
+        'password': PGVECTOR_DB_PASSWORD,
+        'host': PGVECTOR_DB_HOST,
+        'port': PGVECTOR_DB_PORT
+    }
+
+def get_index_settings():
+    if INDEX_TYPE == "ivfflat":
+        return [f"SET ivfflat.probes = {IVFFLAT_PROBES};"]
+    if INDEX_TYPE in ["hnsw", "hnsw_bq"]:
+        return [f"SET hnsw.ef_search = {HNSW_EF_SEARCH};"]
+    return []
+
+def get_search_params(index_type=INDEX_TYPE):
+    # Settings besides the query itself that change what an ANN search returns
+    if index_type == "ivfflat":
+        return ('ivfflat.probes', IVFFLAT_PROBES, VECTOR_COLUMN_TYPE)
+    if index_type == "hnsw_bq":
+        return ('hnsw.ef_search', HNSW_EF_SEARCH, 'oversampling', BQ_OVERSAMPLING_FACTOR, VECTOR_COLUMN_TYPE, KEEP_FULL_VECTORS)
+    if index_type == "hnsw":
+        return ('hnsw.ef_search', HNSW_EF_SEARCH, VECTOR_COLUMN_TYPE)
+    return (VECTOR_COLUMN_TYPE,)
+
+def configure_connection(conn):
+    for statement in get_index_settings():
+        conn.execute(statement)
+    conn.commit()
+
+async def configure_async_connection(conn):
+    # Index GUCs are set once per pooled connection instead of once per query
+    for statement in get_index_settings():
+        await conn.execute(statement)
+    await conn.commit()
+
+class CheckoutMetrics:
+    """Time spent waiting for a pooled connection, over the last max_samples checkouts."""
+
+    def __init__(self, max_samples=1000):
+        self.samples = deque(maxlen=max_samples)
+        self.checkouts = 0
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        with self.lock:
+            self.samples.append(seconds * 1000)
+            self.checkouts += 1
+
+    def snapshot(self):
+        with self.lock:
+            samples = list(self.samples)
+            checkouts = self.checkouts
+        if not samples:
+            return {'checkouts': checkouts}
+        return {
+            'checkouts': checkouts,
+            'checkout_p50_ms': round(float(np.percentile(samples, 50)), 3),
+            'checkout_p95_ms': round(float(np.percentile(samples, 95)), 3),
+            'checkout_max_ms': round(max(samples), 3)
+        }
+
+checkout_metrics = CheckoutMetrics()
+
+async def open_pool():
+    # Called at application startup; the WebSocket handler awaits connections from this pool so a slow
+    # query only holds its own connection, not the event loop
+    global pool
+    pool = AsyncConnectionPool(
+        kwargs=get_connection_kwargs(),
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        timeout=DB_POOL_TIMEOUT,
+        max_idle=DB_POOL_MAX_IDLE,
+        configure=configure_async_connection,
+        check=AsyncConnectionPool.check_connection,
+        name="search",
+        open=False
+    )
+    await pool.open()
+    logger.info(f"Opened connection pool (min_size={DB_POOL_MIN_SIZE}, max_size={DB_POOL_MAX_SIZE}, timeout={DB_POOL_TIMEOUT}s)")
+
+async def close_pool():
+    global pool
+    if pool is not None:
+        await pool.close()
+        pool = None
+        logger.info("Closed connection pool")
+
+def get_pool_stats():
+    # psycopg_pool counters (requests_waiting, requests_wait_ms, pool_size, pool_available, ...) plus checkout latency
+    if pool is None:
+        return {'pool': None}
+    return {**pool.get_stats(), **checkout_metrics.snapshot()}
+
+@asynccontextmanager
+async def get_async_db_connection():
+    if pool is None:
+        raise RuntimeError("Connection pool is not open")
+    start_time = time.perf_counter()
+    try:
+        async with pool.connection() as conn:
+            checkout_metrics.record(time.perf_counter() - start_time)
+            async with conn.cursor() as cursor:
+                yield conn, cursor
+    except psycopg.Error as e:
+        logger.error(f"Database connection error: {e}")
+        raise
+
 @contextmanager
 def get_db_connection():
     conn = None
     cursor = None
     try:
-        conn = psycopg.connect(
-            dbname=PGVECTOR_DB_NAME,
-            user=PGVECTOR_DB_USER,
-            password=PGVECTOR_DB_PASSWORD,
-            host=PGVECTOR_DB_HOST,
-            port=PGVECTOR_DB_PORT
-        )
-        conn.autocommit = True
+        conn = psycopg.connect(**get_connection_kwargs())
+        configure_connection(conn)
+        logger.info(f"Set index parameters for {INDEX_TYPE}")
         cursor = conn.cursor()
-        if INDEX_TYPE == "ivfflat":
-            cursor.execute(f"SET ivfflat.probes = {IVFFLAT_PROBES};")
-            logger.info(f"Set ivfflat.probes to {IVFFLAT_PROBES}")
-        elif INDEX_TYPE == "hnsw":
-            cursor.execute(f"SET hnsw.ef_search = {HNSW_EF_SEARCH};")
-            logger.info(f"Set hnsw.ef_search to {HNSW_EF_SEARCH}")
-        conn.autocommit = False
         yield conn, cursor
     except psycopg.Error as e:
         logger.error(f"Database connection error: {e}")
@@ -37,16 +142,104 @@ def get_db_connection():
         if conn:
             conn.close()
 
-def get_search_query(index_type):
+# query_vector is the SQL expression of the query: a bound parameter, or a column of the unnested batch
+QUERY_VECTOR_PARAM = "%(query_vector)s"
+
+def get_distance_expression(index_type, query_vector=QUERY_VECTOR_PARAM):
+    # halfvec tables (VECTOR_COLUMN_TYPE=halfvec) are searched on the column itself, without a per-row cast
+    if VECTOR_COLUMN_TYPE == "halfvec":
+        return f"chunk_vector <#> {query_vector}::halfvec(3072)"
     vector_type = "halfvec(3072)" if index_type in ["hnsw", "ivfflat"] else "vector(3072)"
+    return f"chunk_vector::{vector_type} <#> {query_vector}::{vector_type}"
+
+def get_rerank_expression(query_vector=QUERY_VECTOR_PARAM):
+    # Exact inner product used to rerank binary-quantized candidates, on the most precise vector stored
+    if VECTOR_COLUMN_TYPE == "halfvec" and KEEP_FULL_VECTORS:
+        return f"chunk_vector_full <#> {query_vector}::vector(3072)"
+    if VECTOR_COLUMN_TYPE == "halfvec":
+        return f"chunk_vector <#> {query_vector}::halfvec(3072)"
+    return f"chunk_vector <#> {query_vector}::vector(3072)"
+
+def get_search_query(index_type, filter_categories=False, table_name=DOCUMENT_TABLE_NAME, query_vector=QUERY_VECTOR_PARAM):
+    # Named parameters: query_vector, top_n, categories (filter_categories) and candidates (hnsw_bq).
+    # On a partitioned DOCUMENT_TABLE_NAME the category filter prunes partitions; without it the planner
+    # merges the top-k of every partition's index scan.
+    where_clause = "WHERE business_category = ANY(%(categories)s)" if filter_categories else ""
+    if index_type == "hnsw_bq":
+        # First stage walks the Hamming-distance HNSW index over binary_quantize(chunk_vector) for
+        # top_n * BQ_OVERSAMPLING_FACTOR candidates, which are then reranked by exact inner product
+        return f"""
+    SELECT file_name, document_page, chunk_no, chunk_text, ({get_rerank_expression(query_vector)}) AS distance
+    FROM (
+        SELECT * FROM {table_name}
+        {where_clause}
+        ORDER BY binary_quantize(chunk_vector)::bit(3072) <~> binary_quantize({query_vector}::vector(3072))
+        LIMIT %(candidates)s
+    ) candidates
+    ORDER BY distance ASC
+    LIMIT %(top_n)s;
+    """
     return f"""
     SELECT file_name, document_page, chunk_no, chunk_text,
-            (chunk_vector::{vector_type} <#> %s::{vector_type}) AS distance
-    FROM document_vectors
+            ({get_distance_expression(index_type, query_vector)}) AS distance
+    FROM {table_name}
+    {where_clause}
     ORDER BY distance ASC
-    LIMIT %s;
+    LIMIT %(top_n)s;
+    """
+
+def get_batch_search_query(index_type, filter_categories=False, table_name=DOCUMENT_TABLE_NAME):
+    # One statement for many queries: the single-query search runs LATERAL for every unnested query vector,
+    # so each one still gets its own index scan and LIMIT. Rows come back as (ord, file_name, ..., distance)
+    # with ord the 1-based position of the query in query_vectors.
+    search_query = get_search_query(index_type, filter_categories, table_name, query_vector="q.query_vector")
+    return f"""
+    SELECT q.ord, r.file_name, r.document_page, r.chunk_no, r.chunk_text, r.distance
+    FROM unnest(%(query_vectors)s::text[]) WITH ORDINALITY AS q(query_vector, ord)
+    CROSS JOIN LATERAL ({search_query.strip().rstrip(';')}) r
+    ORDER BY q.ord, r.distance ASC;
     """
 
-def get_row_count(cursor):
-    cursor.execute("SELECT COUNT(*) FROM document_vectors;")
-    return cursor.fetchone()[0]
+def get_search_statements(index_type, query_vector, top_n, categories=None, table_name=DOCUMENT_TABLE_NAME,
+                          oversampling_factor=BQ_OVERSAMPLING_FACTOR, batch=False):
+    # [(sql, params), ...] to execute in order on one transaction; the last one returns the results.
+    # With batch=True query_vector is a list of query vectors.
+    if batch:
+        # Sent as vector literals in a text[]; pgvector casts each one in the LATERAL subquery
+        params = {'query_vectors': ['[' + ','.join(map(str, vector)) + ']' for vector in query_vector]}
+        search_query = get_batch_search_query(index_type, filter_categories=bool(categories), table_name=table_name)
+    else:
+        params = {'query_vector': query_vector}
+        search_query = get_search_query(index_type, filter_categories=bool(categories), table_name=table_name)
+    params.update({'top_n': top_n, 'categories': categories})
+    statements = []
+    if index_type == "hnsw_bq":
+        params['candidates'] = top_n * oversampling_factor
+        # An HNSW scan returns at most ef_search rows, so it has to cover every candidate (1000 is the maximum)
+        statements.append(("SELECT set_config('hnsw.ef_search', %s, true);",
+                           (str(min(1000, max(HNSW_EF_SEARCH, params['candidates']))),)))
+    statements.append((search_query, params))
+    return statements
+
+def search_chunks(cursor, index_type, query_vector, top_n, categories=None, table_name=DOCUMENT_TABLE_NAME,
+                  oversampling_factor=BQ_OVERSAMPLING_FACTOR):
+    for query, params in get_search_statements(index_type, query_vector, top_n, categories, table_name, oversampling_factor):
+        cursor.execute(query, params)
+    return cursor.fetchall()
+
+async def async_search_chunks(cursor, index_type, query_vector, top_n, categories=None, table_name=DOCUMENT_TABLE_NAME,
+                              oversampling_factor=BQ_OVERSAMPLING_FACTOR):
+    for query, params in get_search_statements(index_type, query_vector, top_n, categories, table_name, oversampling_factor):
+        await cursor.execute(query, params)
+    return await cursor.fetchall()
+
+async def async_batch_search_chunks(cursor, index_type, query_vectors, top_n, categories=None, table_name=DOCUMENT_TABLE_NAME,
+                                    oversampling_factor=BQ_OVERSAMPLING_FACTOR):
+    # Results of all query_vectors in one round trip, as one list of rows per query vector
+    for query, params in get_search_statements(index_type, query_vectors, top_n, categories, table_name,
+                                               oversampling_factor, batch=True):
+        await cursor.execute(query, params)
+    results = [[] for _ in query_vectors]
+    for position, *row in await cursor.fetchall():
+        results[position - 1].append(tuple(row))
+    return results
@@ -8,6 +8,9 @@ import asyncio
 import logging
 import time
 import os
+import threading
+from bisect import bisect_left, bisect_right
+from collections import deque
 from dateutil import parser
 from config import (
     SEARCH_CSV_OUTPUT_DIR, INDEX_TYPE, HNSW_M, HNSW_EF_CONSTRUCTION,
@@ -29,15 +32,69 @@ def get_container_memory_stats(container_name):
         logger.exception("Full traceback:")
     return None
 
-async def collect_memory_stats(container_name, duration, interval=0.1):
-    start_time = time.time()
-    stats_list = []
-    while time.time() - start_time < duration:
-        stats = get_container_memory_stats(container_name)
-        if stats:
-            stats_list.append(stats)
-        await asyncio.sleep(interval)
-    return stats_list[0] if stats_list else None  # Return only the first stat
+class ContainerStatsSampler:
+    """Background thread reading the streaming Docker stats API into a ring buffer of (receive time, stats).
+
+    The daemon pushes one sample per second per stream, so searches look up the samples around their start and
+    end instead of polling the API themselves.
+    """
+
+    def __init__(self, container_name, max_samples=600, retry_interval=5.0):
+        self.container_name = container_name
+        self.samples = deque(maxlen=max_samples)
+        self.retry_interval = retry_interval
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, name="container-stats", daemon=True)
+        self.thread.start()
+        logger.info(f"Started container stats sampler for {self.container_name}")
+
+    def stop(self):
+        # The stats stream blocks until the next sample, so the daemon thread is not joined
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.is_set():
+            try:
+                container = docker.from_env().containers.get(self.container_name)
+                for stats in container.stats(stream=True, decode=True):
+                    with self.lock:
+                        self.samples.append((time.time(), stats))
+                    if self.stopped.is_set():
+                        return
+            except docker.errors.NotFound:
+                logger.error(f"Container {self.container_name} not found")
+            except Exception as e:
+                logger.error(f"Error streaming container stats: {str(e)}")
+            self.stopped.wait(self.retry_interval)
+
+    def get_sample_before(self, timestamp):
+        # Latest sample received at or before timestamp (or the oldest one if none is that old)
+        with self.lock:
+            samples = list(self.samples)
+        if not samples:
+            return None
+        index = bisect_right([t for t, _ in samples], timestamp)
+        return samples[max(index - 1, 0)][1]
+
+    def get_sample_after(self, timestamp):
+        with self.lock:
+            samples = list(self.samples)
+        index = bisect_left([t for t, _ in samples], timestamp)
+        return samples[index][1] if index < len(samples) else None
+
+    async def wait_for_sample_after(self, timestamp, timeout=2.0, interval=0.1):
+        # First sample received at or after timestamp; falls back to the latest one after timeout
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            stats = self.get_sample_after(timestamp)
+            if stats is not None:
+                return stats
+            await asyncio.sleep(interval)
+        return self.get_sample_before(time.time())
 
 def parse_timestamp(timestamp_str):
     try:
@@ -46,7 +103,7 @@ def parse_timestamp(timestamp_str):
         logger.error(f"Error parsing timestamp: {str(e)}")
         return datetime.now(pytz.utc)
 
-def save_memory_stats_with_extra_info(stats, filename, num_of_rows, search_time, keyword, filepath, page, target_rank):
+def save_memory_stats_with_extra_info(stats, filename, num_of_rows, search_time, keyword, filepath, page, target_rank, embedding_time=None, cache_hit=False):
     try:
         jst = pytz.timezone('Asia/Tokyo')
 
@@ -60,6 +117,8 @@ def save_memory_stats_with_extra_info(stats, filename, num_of_rows, search_time,
             'ivfflat_probes': int(IVFFLAT_PROBES),
             'num_of_rows': int(num_of_rows),
             'search_time': round(float(search_time), 4),
+            'embedding_time': round(float(embedding_time), 4) if embedding_time is not None else None,
+            'cache_hit': int(bool(cache_hit)),
             'target_rank': int(target_rank) if target_rank is not None else None,
             'keyword': str(keyword),
             'filepath': str(filepath) if filepath else '',
@@ -77,11 +136,11 @@ def save_memory_stats_with_extra_info(stats, filename, num_of_rows, search_time,
 
         columns = [
             'index_type', 'hnsw_m', 'hnsw_ef_construction', 'hnsw_ef_search', 'ivfflat_lists', 'ivfflat_probes',
-            'num_of_rows', 'search_time', 'target_rank', 'keyword', 'filepath', 'page', 'timestamp',
+            'num_of_rows', 'search_time', 'embedding_time', 'cache_hit', 'target_rank', 'keyword', 'filepath', 'page', 'timestamp',
             'usage', 'limit'
         ] + [col for col in df.columns if col not in [
             'index_type', 'hnsw_m', 'hnsw_ef_construction', 'hnsw_ef_search', 'ivfflat_lists', 'ivfflat_probes',
-            'num_of_rows', 'search_time', 'target_rank', 'keyword', 'filepath', 'page', 'timestamp',
+            'num_of_rows', 'search_time', 'embedding_time', 'cache_hit', 'target_rank', 'keyword', 'filepath', 'page', 'timestamp',
             'usage', 'limit'
         ]]
         df = df[columns]
@@ -89,7 +148,7 @@ def save_memory_stats_with_extra_info(stats, filename, num_of_rows, search_time,
         # Explicitly set integer columns to int64 dtype, handling None values
         int_columns = ['hnsw_m', 'hnsw_ef_construction', 'hnsw_ef_search', 'ivfflat_lists', 'ivfflat_probes',
                         'num_of_rows', 'target_rank', 'page', 'usage', 'limit'] + [col for col in df.columns if col not in [
-                        'index_type', 'search_time', 'keyword', 'filepath', 'timestamp'
+                        'index_type', 'search_time', 'embedding_time', 'keyword', 'filepath', 'timestamp'
         ]]
         for col in int_columns:
             df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')  # Use 'Int64' instead of 'int64'
@@ -105,7 +164,7 @@ def save_memory_stats_with_extra_info(stats, filename, num_of_rows, search_time,
             df = pd.concat([existing_df, df], ignore_index=True)
 
         df.index.name = 'index'
-        df.to_csv(filename, float_format='%.4f')  # Use float_format for search_time
+        df.to_csv(filename, float_format='%.4f')  # Use float_format for search_time and embedding_time
         logger.info(f"Memory stats saved to {filename}")
     except Exception as e:
         logger.error(f"Error saving memory stats: {str(e)}")
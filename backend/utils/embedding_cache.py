@@ -0,0 +1,135 @@
+# pgvector-ann/backend/utils/embedding_cache.py
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+import unicodedata
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+def normalize_text(text):
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r'\s+', ' ', text).strip()
+
+def make_cache_key(model, text):
+    return hashlib.sha256(f"{model}\x00{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """SQLite-backed embedding store keyed by hash(model, normalized text) with LRU eviction by total size."""
+
+    def __init__(self, path, max_bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL;")
+        self.conn.execute("PRAGMA synchronous=NORMAL;")
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            vector BLOB,
+            prompt_tokens INTEGER,
+            total_tokens INTEGER,
+            size INTEGER,
+            created_at REAL,
+            last_access REAL
+        );
+        """)
+        self.conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access_idx ON embeddings (last_access);")
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM embeddings;").fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def get_many(self, model, texts, max_age=None):
+        # Returns one entry per text: dict(model, prompt_tokens, total_tokens, chunk_vector) or None on miss
+        keys = [make_cache_key(model, text) for text in texts]
+        found = {}
+        now = time.time()
+        unique_keys = list(dict.fromkeys(keys))
+        for start in range(0, len(unique_keys), 500):
+            part = unique_keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT key, model, vector, prompt_tokens, total_tokens, created_at FROM embeddings "
+                f"WHERE key IN ({','.join('?' * len(part))});", part
+            ).fetchall()
+            for key, cached_model, vector, prompt_tokens, total_tokens, created_at in rows:
+                if max_age is not None and now - created_at > max_age:
+                    continue
+                found[key] = {
+                    'model': cached_model,
+                    'prompt_tokens': prompt_tokens,
+                    'total_tokens': total_tokens,
+                    'chunk_vector': np.frombuffer(vector, dtype=np.float32)
+                }
+        if found:
+            self.conn.executemany("UPDATE embeddings SET last_access = ? WHERE key = ?;", [(now, key) for key in found])
+            self.conn.commit()
+
+        results = [found.get(key) for key in keys]
+        hit_count = sum(1 for result in results if result is not None)
+        self.hits += hit_count
+        self.misses += len(results) - hit_count
+        return results
+
+    def get(self, model, text, max_age=None):
+        return self.get_many(model, [text], max_age)[0]
+
+    def put_many(self, model, entries):
+        # entries: iterable of (text, dict(model, prompt_tokens, total_tokens, chunk_vector))
+        now = time.time()
+        rows = []
+        for text, entry in entries:
+            vector = np.asarray(entry['chunk_vector'], dtype=np.float32).tobytes()
+            rows.append((make_cache_key(model, text), entry['model'], vector, entry['prompt_tokens'],
+                         entry['total_tokens'], len(vector), now, now))
+        if not rows:
+            return
+        keys = [row[0] for row in rows]
+        replaced = 0
+        for start in range(0, len(keys), 500):
+            part = keys[start:start + 500]
+            replaced += self.conn.execute(
+                f"SELECT COALESCE(SUM(size), 0) FROM embeddings WHERE key IN ({','.join('?' * len(part))});", part
+            ).fetchone()[0]
+        self.conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?, ?, ?, ?);", rows)
+        self.conn.commit()
+        self.total_bytes += sum(row[5] for row in {row[0]: row for row in rows}.values()) - replaced
+        if self.total_bytes > self.max_bytes:
+            self.evict()
+
+    def put(self, model, text, entry):
+        self.put_many(model, [(text, entry)])
+
+    def evict(self):
+        # Drop least recently used entries until the cache is back under 90% of max_bytes
+        target = int(self.max_bytes * 0.9)
+        while self.total_bytes > target:
+            rows = self.conn.execute("SELECT key, size FROM embeddings ORDER BY last_access ASC LIMIT 1000;").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            to_delete = []
+            for key, size in rows:
+                to_delete.append((key,))
+                self.total_bytes -= size
+                if self.total_bytes <= target:
+                    break
+            self.conn.executemany("DELETE FROM embeddings WHERE key = ?;", to_delete)
+            self.conn.commit()
+            self.evicted += len(to_delete)
+        logger.info(f"Embedding cache evicted entries down to {self.total_bytes} bytes ({self.evicted} evicted so far)")
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        hit_ratio = self.hits / lookups if lookups else 0.0
+        logger.info(f"Embedding cache {self.path}: {self.hits} hits, {self.misses} misses "
+                    f"(hit ratio {hit_ratio:.2%}), {self.total_bytes} bytes stored, {self.evicted} evicted")
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,157 @@
+# pgvector-ann/backend/utils/embedding_scheduler.py
+import asyncio
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from openai import AsyncOpenAI, AsyncAzureOpenAI, RateLimitError, APIStatusError, APIConnectionError
+from config import (
+    ENABLE_OPENAI, OPENAI_API_KEY, OPENAI_BASE_URL, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY,
+    AZURE_OPENAI_API_VERSION, EMBEDDING_CONCURRENCY, EMBEDDING_TPM_LIMIT, EMBEDDING_RPM_LIMIT,
+    EMBEDDING_MAX_RETRIES, EMBEDDING_BACKOFF_BASE, EMBEDDING_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+def split_usage(total, weights):
+    # Distribute a batch-level token count across its inputs proportionally to their weights.
+    # Largest-remainder rounding keeps the per-row values summing exactly to the batch total.
+    weight_sum = sum(weights)
+    if weight_sum == 0:
+        weights = [1] * len(weights)
+        weight_sum = len(weights)
+    shares = [total * w / weight_sum for w in weights]
+    allocated = [int(share) for share in shares]
+    remainder = total - sum(allocated)
+    order = sorted(range(len(shares)), key=lambda i: shares[i] - allocated[i], reverse=True)
+    for i in order[:remainder]:
+        allocated[i] += 1
+    return allocated
+
+def create_async_client():
+    # Retries are handled by EmbeddingScheduler, so the SDK's own retry loop is disabled
+    if ENABLE_OPENAI:
+        return AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, max_retries=0)
+    return AsyncAzureOpenAI(
+        azure_endpoint=AZURE_OPENAI_ENDPOINT,
+        api_key=AZURE_OPENAI_API_KEY,
+        api_version=AZURE_OPENAI_API_VERSION,
+        max_retries=0
+    )
+
+def get_retry_after(error):
+    # Seconds requested by the server through retry-after-ms / retry-after headers, if any
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        retry_after = headers.get("retry-after")
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+    except (TypeError, ValueError):
+        logger.warning(f"Could not parse Retry-After header: {dict(headers)}")
+    return None
+
+class RateLimiter:
+    """Token bucket refilled continuously at limit_per_minute units per minute (0 disables it)."""
+
+    def __init__(self, limit_per_minute):
+        self.capacity = limit_per_minute
+        self.available = float(limit_per_minute)
+        self.rate = limit_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self, amount):
+        if self.capacity <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.available >= amount:
+                    self.available -= amount
+                    return waited
+                delay = (amount - self.available) / self.rate
+                waited += delay
+                await asyncio.sleep(delay)
+
+class EmbeddingScheduler:
+    """Runs embedding requests concurrently within RPM/TPM budgets, backing off on 429s and transient errors."""
+
+    def __init__(self, client, model, concurrency=EMBEDDING_CONCURRENCY, tpm_limit=EMBEDDING_TPM_LIMIT,
+                 rpm_limit=EMBEDDING_RPM_LIMIT, max_retries=EMBEDDING_MAX_RETRIES,
+                 backoff_base=EMBEDDING_BACKOFF_BASE, backoff_max=EMBEDDING_BACKOFF_MAX):
+        self.client = client
+        self.model = model
+        self.semaphore = asyncio.Semaphore(max(1, concurrency))
+        self.request_limiter = RateLimiter(rpm_limit)
+        self.token_limiter = RateLimiter(tpm_limit)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        # A 429 pauses every worker, not just the one that received it
+        self.paused_until = 0.0
+        self.stats = {"requests": 0, "retries": 0, "rate_limited": 0, "throttle_wait": 0.0, "backoff_wait": 0.0}
+
+    def backoff_delay(self, attempt, retry_after):
+        if retry_after is not None:
+            return min(self.backoff_max, retry_after)
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    async def embed(self, texts, token_count):
+        async with self.semaphore:
+            for attempt in range(self.max_retries + 1):
+                pause = self.paused_until - time.monotonic()
+                if pause > 0:
+                    self.stats["backoff_wait"] += pause
+                    await asyncio.sleep(pause)
+                self.stats["throttle_wait"] += await self.request_limiter.acquire(1)
+                self.stats["throttle_wait"] += await self.token_limiter.acquire(token_count)
+
+                try:
+                    self.stats["requests"] += 1
+                    # base64 lets the caller decode straight into float32 instead of lists of Python floats
+                    return await self.client.embeddings.create(input=texts, model=self.model, encoding_format="base64")
+                except (RateLimitError, APIStatusError, APIConnectionError) as e:
+                    status = getattr(e, "status_code", None)
+                    retryable = isinstance(e, (RateLimitError, APIConnectionError)) or (status is not None and status >= 500)
+                    if not retryable or attempt == self.max_retries:
+                        raise
+                    retry_after = get_retry_after(e)
+                    delay = self.backoff_delay(attempt, retry_after)
+                    self.stats["retries"] += 1
+                    if isinstance(e, RateLimitError):
+                        self.stats["rate_limited"] += 1
+                        self.paused_until = max(self.paused_until, time.monotonic() + delay)
+                    logger.warning(f"Embedding request failed ({status or type(e).__name__}), "
+                                   f"retrying in {delay:.2f}s (attempt {attempt + 1}/{self.max_retries})")
+                    self.stats["backoff_wait"] += delay
+                    await asyncio.sleep(delay)
+
+    async def embed_batches(self, batches):
+        # batches: list of (texts, token_count); responses are returned in the same order
+        return await asyncio.gather(*(self.embed(texts, token_count) for texts, token_count in batches))
+
+    def log_stats(self):
+        logger.info(f"Embedding scheduler: {self.stats['requests']} requests, {self.stats['retries']} retries "
+                    f"({self.stats['rate_limited']} rate limited), throttle wait {self.stats['throttle_wait']:.2f}s, "
+                    f"backoff wait {self.stats['backoff_wait']:.2f}s")
+
+async def run_embedding_batches(model, batches):
+    async with create_async_client() as client:
+        scheduler = EmbeddingScheduler(client, model)
+        try:
+            return await scheduler.embed_batches(batches)
+        finally:
+            scheduler.log_stats()
@@ -0,0 +1,107 @@
+# pgvector-ann/backend/utils/embedding_stub_server.py
+# OpenAI-compatible embeddings stub for offline testing of the vectorizer and EmbeddingScheduler.
+#
+#   STUB_LATENCY_MS=300 STUB_RATE_LIMIT_PROBABILITY=0.1 python utils/embedding_stub_server.py
+#   ENABLE_OPENAI=true OPENAI_API_KEY=stub OPENAI_BASE_URL=http://localhost:8100/v1 python src/vectorizer.py
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import random
+import time
+from collections import deque
+import numpy as np
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(message)s')
+logger = logging.getLogger(__name__)
+
+STUB_PORT = int(os.getenv("STUB_PORT", "8100"))
+STUB_DIMENSIONS = int(os.getenv("STUB_DIMENSIONS", "3072"))
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "200"))
+STUB_LATENCY_JITTER_MS = float(os.getenv("STUB_LATENCY_JITTER_MS", "50"))
+STUB_RATE_LIMIT_PROBABILITY = float(os.getenv("STUB_RATE_LIMIT_PROBABILITY", "0.0"))
+STUB_RPM_LIMIT = int(os.getenv("STUB_RPM_LIMIT", "0"))
+STUB_RETRY_AFTER = float(os.getenv("STUB_RETRY_AFTER", "1"))
+
+app = FastAPI()
+request_times = deque()
+stats = {"requests": 0, "inputs": 0, "rate_limited": 0}
+
+def fake_embedding(text):
+    # Deterministic unit vector derived from the input text
+    seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+    vector = np.random.default_rng(seed).standard_normal(STUB_DIMENSIONS).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def rate_limited_response():
+    stats["rate_limited"] += 1
+    return JSONResponse(
+        status_code=429,
+        headers={"retry-after": str(STUB_RETRY_AFTER)},
+        content={"error": {"message": "Rate limit exceeded (stub)", "type": "rate_limit_error", "code": "429"}}
+    )
+
+def is_over_rpm_limit():
+    if STUB_RPM_LIMIT <= 0:
+        return False
+    now = time.monotonic()
+    while request_times and now - request_times[0] > 60:
+        request_times.popleft()
+    if len(request_times) >= STUB_RPM_LIMIT:
+        return True
+    request_times.append(now)
+    return False
+
+async def create_embeddings(request: Request, model: str):
+    body = await request.json()
+    inputs = body["input"]
+    if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+        inputs = [inputs]
+
+    latency = max(0.0, random.gauss(STUB_LATENCY_MS, STUB_LATENCY_JITTER_MS)) / 1000
+    await asyncio.sleep(latency)
+
+    if random.random() < STUB_RATE_LIMIT_PROBABILITY or is_over_rpm_limit():
+        return rate_limited_response()
+
+    stats["requests"] += 1
+    stats["inputs"] += len(inputs)
+    data = []
+    prompt_tokens = 0
+    for i, text in enumerate(inputs):
+        text = text if isinstance(text, str) else " ".join(map(str, text))
+        vector = fake_embedding(text)
+        if body.get("encoding_format") == "base64":
+            embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+        else:
+            embedding = vector.tolist()
+        data.append({"object": "embedding", "index": i, "embedding": embedding})
+        prompt_tokens += max(1, len(text) // 4)
+
+    return {
+        "object": "list",
+        "data": data,
+        "model": model or body.get("model", "stub-embedding"),
+        "usage": {"prompt_tokens": prompt_tokens, "total_tokens": prompt_tokens}
+    }
+
+@app.post("/v1/embeddings")
+async def openai_embeddings(request: Request):
+    return await create_embeddings(request, None)
+
+@app.post("/openai/deployments/{deployment}/embeddings")
+async def azure_embeddings(deployment: str, request: Request):
+    return await create_embeddings(request, deployment)
+
+@app.get("/stats")
+async def get_stats():
+    return stats
+
+if __name__ == "__main__":
+    import uvicorn
+    logger.info(f"Starting embedding stub on port {STUB_PORT}: latency {STUB_LATENCY_MS}ms, "
+                f"429 probability {STUB_RATE_LIMIT_PROBABILITY}, RPM limit {STUB_RPM_LIMIT}")
+    uvicorn.run(app, host="0.0.0.0", port=STUB_PORT)
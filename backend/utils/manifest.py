@@ -0,0 +1,90 @@
+# pgvector-ann/backend/utils/manifest.py
+# Per-PDF manifests of the vectorizer and stream pipeline: which PDFs were processed, with which settings, and
+# where their outputs are. Kept apart from vectorizer.py so scripts that only read or rewrite a manifest
+# (convert_csv_vectors.py) do not load the tokenizer or open the embedding cache.
+import hashlib
+import json
+import logging
+import os
+from config import (
+    ENABLE_OPENAI, AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT, CHUNK_SIZE, CHUNK_OVERLAP, SEPARATOR, VECTOR_STORAGE_FORMAT,
+    VECTOR_STORAGE_DTYPE, VECTORIZER_MANIFEST_PATH, VECTORIZER_FULL_REBUILD, PDF_INPUT_DIR
+)
+from utils.vector_store import remove_vector_table
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_MODEL = "text-embedding-3-large" if ENABLE_OPENAI else AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT
+
+def get_manifest_settings():
+    # Outputs are only reusable if they were produced with the same chunking and embedding settings
+    return {
+        'chunk_size': CHUNK_SIZE,
+        'chunk_overlap': CHUNK_OVERLAP,
+        'separator': SEPARATOR,
+        'model': EMBEDDING_MODEL,
+        'vector_storage_format': VECTOR_STORAGE_FORMAT,
+        'vector_storage_dtype': VECTOR_STORAGE_DTYPE if VECTOR_STORAGE_FORMAT == "npy" else None
+    }
+
+def load_manifest(manifest_path=VECTORIZER_MANIFEST_PATH):
+    if os.path.exists(manifest_path):
+        try:
+            with open(manifest_path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read manifest {manifest_path}, rebuilding from scratch: {str(e)}")
+    return {'settings': None, 'files': {}}
+
+def save_manifest(manifest, manifest_path=VECTORIZER_MANIFEST_PATH):
+    os.makedirs(os.path.dirname(manifest_path), exist_ok=True)
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+def compute_sha256(file_path):
+    sha256 = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+def diff_pdf_files(pdf_files, manifest):
+    # Split PDFs into changed (new or modified) and deleted relative to the manifest.
+    # size/mtime is the fast path; sha256 is only computed when they differ.
+    entries = manifest['files']
+    rebuild = VECTORIZER_FULL_REBUILD or manifest.get('settings') != get_manifest_settings()
+    changed = []
+    seen = set()
+    for file_path in pdf_files:
+        relative_path = os.path.relpath(file_path, PDF_INPUT_DIR)
+        seen.add(relative_path)
+        entry = entries.get(relative_path)
+        stat = os.stat(file_path)
+        # Files that produced no rows are retried, as the empty result may come from a transient failure
+        if rebuild or entry is None or entry.get('status') == 'empty' or (entry.get('output') and not os.path.exists(entry['output'])):
+            changed.append(file_path)
+        elif entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+            continue
+        elif entry['size'] == stat.st_size and entry['sha256'] == compute_sha256(file_path):
+            entry['mtime'] = stat.st_mtime  # touched but identical content
+        else:
+            changed.append(file_path)
+    deleted = [relative_path for relative_path in entries if relative_path not in seen]
+    return changed, deleted, rebuild
+
+def begin_manifest_update(manifest, deleted, rebuild):
+    # Removes the entries and outputs of deleted PDFs, then starts from an empty manifest on a full rebuild.
+    # Deletions have to go first: the old entries are the only record of where those outputs are.
+    # Returns (manifest to update, paths of the deleted PDFs)
+    removed_file_names = set()
+    for relative_path in deleted:
+        entry = manifest['files'].pop(relative_path, None)
+        if entry and entry.get('output') and os.path.exists(entry['output']):
+            remove_vector_table(entry['output'])
+            logger.info(f"Removed output for deleted PDF: {entry['output']}")
+        removed_file_names.add(os.path.join(PDF_INPUT_DIR, relative_path))
+    if rebuild:
+        manifest = {'settings': get_manifest_settings(), 'files': {}}
+    return manifest, removed_file_names
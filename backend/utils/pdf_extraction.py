@@ -0,0 +1,119 @@
+# pgvector-ann/backend/utils/pdf_extraction.py
+import logging
+import os
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from pypdf import PdfReader
+from langchain_text_splitters import CharacterTextSplitter
+from config import CHUNK_SIZE, CHUNK_OVERLAP, SEPARATOR, PDF_EXTRACT_WORKERS, PDF_PAGES_PER_TASK
+
+logger = logging.getLogger(__name__)
+
+def split_text_into_chunks(text):
+    text_splitter = CharacterTextSplitter(
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        separator=SEPARATOR
+    )
+    chunks = text_splitter.split_text(text)
+    return chunks if chunks else [text]
+
+def get_page_count(file_path):
+    with open(file_path, 'rb') as file:
+        return len(PdfReader(file).pages)
+
+def extract_page_range(file_path, start, end):
+    # Runs in a worker process: extract and chunk pages [start, end) of one PDF
+    started = time.perf_counter()
+    pages = []
+    with open(file_path, 'rb') as file:
+        pdf = PdfReader(file)
+        for i in range(start, end):
+            page_text = pdf.pages[i].extract_text()
+            chunks = split_text_into_chunks(page_text)
+            if not chunks and page_text:
+                chunks = [page_text]
+            pages.append({"page": i + 1, "chunks": [chunk for chunk in chunks if chunk.strip()]})
+    return {"pages": pages, "pid": os.getpid(), "elapsed": time.perf_counter() - started}
+
+def get_page_ranges(page_count):
+    return [(start, min(start + PDF_PAGES_PER_TASK, page_count)) for start in range(0, page_count, PDF_PAGES_PER_TASK)]
+
+class WorkerStats:
+    def __init__(self):
+        self.pages = defaultdict(int)
+        self.elapsed = defaultdict(float)
+
+    def add(self, result):
+        self.pages[result["pid"]] += len(result["pages"])
+        self.elapsed[result["pid"]] += result["elapsed"]
+
+    def log(self):
+        for pid in sorted(self.pages):
+            rate = self.pages[pid] / self.elapsed[pid] if self.elapsed[pid] > 0 else 0.0
+            logger.info(f"PDF extraction worker {pid}: {self.pages[pid]} pages in {self.elapsed[pid]:.2f}s ({rate:.2f} pages/sec)")
+        total_pages = sum(self.pages.values())
+        total_elapsed = sum(self.elapsed.values())
+        if total_elapsed > 0:
+            logger.info(f"PDF extraction total: {total_pages} pages, {total_pages / total_elapsed:.2f} pages/sec per worker "
+                        f"across {len(self.pages)} workers")
+
+def submit_file(executor, file_path):
+    try:
+        return [executor.submit(extract_page_range, file_path, start, end)
+                for start, end in get_page_ranges(get_page_count(file_path))]
+    except Exception as e:
+        logger.error(f"Error reading PDF {file_path}: {str(e)}")
+        return None
+
+def extract_pdf_files(file_paths, workers=PDF_EXTRACT_WORKERS):
+    """Yield (file_path, pages) in input order, where pages is [{"page": n, "chunks": [...]}, ...] in page order.
+
+    Page ranges are extracted on a process pool. Up to 2 * workers files are kept in flight, so later files
+    are extracted while earlier ones are being embedded without buffering the whole corpus.
+    pages is None if the file could not be read.
+    """
+    stats = WorkerStats()
+    if workers <= 1:
+        for file_path in file_paths:
+            try:
+                result = extract_page_range(file_path, 0, get_page_count(file_path))
+                stats.add(result)
+                yield file_path, result["pages"]
+            except Exception as e:
+                logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
+                yield file_path, None
+        stats.log()
+        return
+
+    pending_files = iter(file_paths)
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        while True:
+            while len(in_flight) < workers * 2:
+                file_path = next(pending_files, None)
+                if file_path is None:
+                    break
+                in_flight.append((file_path, submit_file(executor, file_path)))
+            if not in_flight:
+                break
+
+            file_path, futures = in_flight.popleft()
+            if futures is None:
+                yield file_path, None
+                continue
+            pages = []
+            try:
+                for future in futures:
+                    result = future.result()
+                    stats.add(result)
+                    pages.extend(result["pages"])
+            except Exception as e:
+                logger.error(f"Error extracting text from PDF {file_path}: {str(e)}")
+                for future in futures:
+                    future.cancel()
+                yield file_path, None
+                continue
+            yield file_path, pages
+    stats.log()
@@ -0,0 +1,33 @@
+# pgvector-ann/backend/utils/pipeline_summary.py
+# Small JSON handoff between pipeline scripts and run_pipeline.py, which runs them as subprocesses
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+PIPELINE_SUMMARY_DIR = "/app/data/log/summary"
+
+def get_summary_path(script_name):
+    return os.path.join(PIPELINE_SUMMARY_DIR, f"{os.path.splitext(script_name)[0]}.json")
+
+def write_summary(script_name, summary):
+    os.makedirs(PIPELINE_SUMMARY_DIR, exist_ok=True)
+    with open(get_summary_path(script_name), 'w') as f:
+        json.dump(summary, f, indent=2, default=str)
+
+def read_summary(script_name):
+    path = get_summary_path(script_name)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.error(f"Could not read pipeline summary {path}: {str(e)}")
+        return {}
+
+def clear_summary(script_name):
+    path = get_summary_path(script_name)
+    if os.path.exists(path):
+        os.remove(path)
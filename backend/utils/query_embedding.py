@@ -0,0 +1,267 @@
+# pgvector-ann/backend/utils/query_embedding.py
+# Query-time embeddings for the backend. A single AsyncOpenAI/AsyncAzureOpenAI client shares one httpx
+# connection pool across all WebSocket handlers, so concurrent questions overlap their API round trips
+# instead of blocking the event loop one after another.
+#
+# Repeated questions are answered from QueryEmbeddingCache (in-process, LRU with TTL and a byte budget) and,
+# when QUERY_EMBEDDING_SHARED_CACHE_PATH is set, from a SQLite EmbeddingCache shared by workers and restarts.
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+import httpx
+import numpy as np
+from openai import AsyncOpenAI, AsyncAzureOpenAI
+from config import (
+    ENABLE_OPENAI, OPENAI_API_KEY, OPENAI_BASE_URL, AZURE_OPENAI_ENDPOINT, AZURE_OPENAI_API_KEY,
+    AZURE_OPENAI_API_VERSION, AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT, QUERY_EMBEDDING_MAX_CONNECTIONS,
+    QUERY_EMBEDDING_MAX_KEEPALIVE, QUERY_EMBEDDING_KEEPALIVE_EXPIRY, QUERY_EMBEDDING_TIMEOUT,
+    ENABLE_QUERY_EMBEDDING_CACHE, QUERY_EMBEDDING_CACHE_TTL, QUERY_EMBEDDING_CACHE_MAX_BYTES,
+    QUERY_EMBEDDING_SHARED_CACHE_PATH, QUERY_EMBEDDING_SHARED_CACHE_MAX_BYTES
+)
+from utils.embedding_cache import EmbeddingCache, make_cache_key
+from utils.embedding_scheduler import split_usage
+
+logger = logging.getLogger(__name__)
+
+QUERY_EMBEDDING_MODEL = "text-embedding-3-large" if ENABLE_OPENAI else AZURE_OPENAI_EMBEDDINGS_DEPLOYMENT
+
+client = None
+shared_cache = None
+shared_cache_lock = threading.Lock()
+
+class QueryEmbeddingCache:
+    """In-process LRU of query embeddings with a TTL and a total byte budget, plus hit/miss counters."""
+
+    def __init__(self, max_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.api_calls = 0
+        self.api_seconds = 0.0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        vector, created_at = entry
+        if time.time() - created_at > self.ttl:
+            self.remove(key)
+            return None
+        self.entries.move_to_end(key)
+        return vector
+
+    def put(self, key, vector, created_at=None):
+        vector = np.asarray(vector, dtype=np.float32)
+        if vector.nbytes > self.max_bytes:
+            return
+        if key in self.entries:
+            self.remove(key)
+        self.entries[key] = (vector, created_at or time.time())
+        self.total_bytes += vector.nbytes
+        while self.total_bytes > self.max_bytes:
+            oldest = next(iter(self.entries))
+            self.remove(oldest)
+            self.evicted += 1
+
+    def remove(self, key):
+        vector, _ = self.entries.pop(key)
+        self.total_bytes -= vector.nbytes
+
+    def record_api_call(self, seconds):
+        self.api_calls += 1
+        self.api_seconds += seconds
+
+    def record_hit(self, seconds, shared=False):
+        # Saved latency is estimated against the mean embedding API round trip observed so far
+        if shared:
+            self.shared_hits += 1
+        else:
+            self.hits += 1
+        if self.api_calls:
+            self.saved_seconds += max(0.0, self.api_seconds / self.api_calls - seconds)
+
+    def snapshot(self):
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.total_bytes,
+            'max_bytes': self.max_bytes,
+            'ttl': self.ttl,
+            'hits': self.hits,
+            'shared_hits': self.shared_hits,
+            'misses': self.misses,
+            'evicted': self.evicted,
+            'hit_ratio': round((self.hits + self.shared_hits) / lookups, 4) if lookups else 0.0,
+            'api_mean_ms': round(self.api_seconds / self.api_calls * 1000, 2) if self.api_calls else None,
+            'saved_seconds': round(self.saved_seconds, 3)
+        }
+
+query_cache = QueryEmbeddingCache(QUERY_EMBEDDING_CACHE_MAX_BYTES, QUERY_EMBEDDING_CACHE_TTL)
+
+def create_http_client():
+    return httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=QUERY_EMBEDDING_MAX_CONNECTIONS,
+            max_keepalive_connections=QUERY_EMBEDDING_MAX_KEEPALIVE,
+            keepalive_expiry=QUERY_EMBEDDING_KEEPALIVE_EXPIRY
+        ),
+        timeout=httpx.Timeout(QUERY_EMBEDDING_TIMEOUT)
+    )
+
+def open_client():
+    global client, shared_cache
+    if ENABLE_QUERY_EMBEDDING_CACHE and QUERY_EMBEDDING_SHARED_CACHE_PATH and shared_cache is None:
+        shared_cache = EmbeddingCache(QUERY_EMBEDDING_SHARED_CACHE_PATH, QUERY_EMBEDDING_SHARED_CACHE_MAX_BYTES)
+        logger.info(f"Using shared query embedding cache {QUERY_EMBEDDING_SHARED_CACHE_PATH}")
+    if client is not None:
+        return client
+    if ENABLE_OPENAI:
+        client = AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=OPENAI_BASE_URL, http_client=create_http_client())
+    else:
+        client = AsyncAzureOpenAI(
+            azure_endpoint=AZURE_OPENAI_ENDPOINT,
+            api_key=AZURE_OPENAI_API_KEY,
+            api_version=AZURE_OPENAI_API_VERSION,
+            http_client=create_http_client()
+        )
+    logger.info(f"Opened query embedding client for {QUERY_EMBEDDING_MODEL} "
+                f"(max_connections={QUERY_EMBEDDING_MAX_CONNECTIONS}, timeout={QUERY_EMBEDDING_TIMEOUT}s)")
+    return client
+
+async def close_client():
+    global client, shared_cache
+    if client is not None:
+        await client.close()
+        client = None
+    if shared_cache is not None:
+        shared_cache.log_stats()
+        shared_cache.close()
+        shared_cache = None
+
+def get_shared_entry(question):
+    with shared_cache_lock:
+        return shared_cache.get(QUERY_EMBEDDING_MODEL, question, max_age=QUERY_EMBEDDING_CACHE_TTL)
+
+def put_shared_entry(question, entry):
+    with shared_cache_lock:
+        shared_cache.put(QUERY_EMBEDDING_MODEL, question, entry)
+
+def get_shared_entries(questions):
+    with shared_cache_lock:
+        return shared_cache.get_many(QUERY_EMBEDDING_MODEL, questions, max_age=QUERY_EMBEDDING_CACHE_TTL)
+
+def put_shared_entries(entries):
+    with shared_cache_lock:
+        shared_cache.put_many(QUERY_EMBEDDING_MODEL, entries)
+
+def get_cache_stats():
+    stats = query_cache.snapshot()
+    stats['enabled'] = ENABLE_QUERY_EMBEDDING_CACHE
+    stats['shared_cache'] = QUERY_EMBEDDING_SHARED_CACHE_PATH or None
+    return stats
+
+async def embed_query(question, use_cache=True):
+    # Returns (embedding, seconds spent, cache tier that answered: "memory", "shared" or None).
+    # use_cache=False neither reads nor fills the caches (load tests that measure the embedding API)
+    if client is None:
+        raise RuntimeError("Query embedding client is not open")
+    start_time = time.perf_counter()
+    key = make_cache_key(QUERY_EMBEDDING_MODEL, question)
+    use_cache = ENABLE_QUERY_EMBEDDING_CACHE and use_cache
+    if use_cache:
+        vector = query_cache.get(key)
+        if vector is not None:
+            elapsed = time.perf_counter() - start_time
+            query_cache.record_hit(elapsed)
+            return vector.tolist(), elapsed, "memory"
+        if shared_cache is not None:
+            entry = await asyncio.to_thread(get_shared_entry, question)
+            if entry is not None:
+                query_cache.put(key, entry['chunk_vector'])
+                elapsed = time.perf_counter() - start_time
+                query_cache.record_hit(elapsed, shared=True)
+                return entry['chunk_vector'].tolist(), elapsed, "shared"
+        query_cache.misses += 1
+
+    api_start_time = time.perf_counter()
+    response = await client.embeddings.create(input=question, model=QUERY_EMBEDDING_MODEL)
+    query_cache.record_api_call(time.perf_counter() - api_start_time)
+    embedding = response.data[0].embedding
+    if use_cache:
+        query_cache.put(key, embedding)
+        if shared_cache is not None:
+            entry = {
+                'model': response.model,
+                'prompt_tokens': response.usage.prompt_tokens,
+                'total_tokens': response.usage.total_tokens,
+                'chunk_vector': embedding
+            }
+            await asyncio.to_thread(put_shared_entry, question, entry)
+    return embedding, time.perf_counter() - start_time, None
+
+async def embed_queries(questions, use_cache=True):
+    # Batch variant of embed_query: cache lookups per question, then one multi-input API call for the misses.
+    # Returns (embeddings, seconds spent, cache tier per question)
+    if client is None:
+        raise RuntimeError("Query embedding client is not open")
+    start_time = time.perf_counter()
+    keys = [make_cache_key(QUERY_EMBEDDING_MODEL, question) for question in questions]
+    embeddings = [None] * len(questions)
+    tiers = [None] * len(questions)
+    use_cache = ENABLE_QUERY_EMBEDDING_CACHE and use_cache
+    if use_cache:
+        for i, key in enumerate(keys):
+            vector = query_cache.get(key)
+            if vector is not None:
+                embeddings[i], tiers[i] = vector.tolist(), "memory"
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing and shared_cache is not None:
+            entries = await asyncio.to_thread(get_shared_entries, [questions[i] for i in missing])
+            for i, entry in zip(missing, entries):
+                if entry is not None:
+                    query_cache.put(keys[i], entry['chunk_vector'])
+                    embeddings[i], tiers[i] = entry['chunk_vector'].tolist(), "shared"
+        lookup_time = time.perf_counter() - start_time
+        for tier in tiers:
+            if tier is not None:
+                query_cache.record_hit(lookup_time / len(questions), shared=tier == "shared")
+
+    # Duplicate questions in one batch share a single input
+    pending = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            pending.setdefault(keys[i], []).append(i)
+    if pending:
+        query_cache.misses += sum(len(indexes) for indexes in pending.values())
+        inputs = [questions[indexes[0]] for indexes in pending.values()]
+        api_start_time = time.perf_counter()
+        response = await client.embeddings.create(input=inputs, model=QUERY_EMBEDDING_MODEL)
+        query_cache.record_api_call(time.perf_counter() - api_start_time)
+        # Token usage is only reported for the whole request; each input gets a share by its length
+        weights = [len(question) for question in inputs]
+        prompt_tokens = split_usage(response.usage.prompt_tokens, weights)
+        total_tokens = split_usage(response.usage.total_tokens, weights)
+        shared_entries = []
+        for (key, indexes), item, prompt, total in zip(pending.items(), sorted(response.data, key=lambda item: item.index),
+                                                       prompt_tokens, total_tokens):
+            for i in indexes:
+                embeddings[i] = item.embedding
+            if use_cache:
+                query_cache.put(key, item.embedding)
+                shared_entries.append((questions[indexes[0]], {
+                    'model': response.model,
+                    'prompt_tokens': prompt,
+                    'total_tokens': total,
+                    'chunk_vector': item.embedding
+                }))
+        if shared_entries and shared_cache is not None:
+            await asyncio.to_thread(put_shared_entries, shared_entries)
+    return embeddings, time.perf_counter() - start_time, tiers
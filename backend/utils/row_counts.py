@@ -0,0 +1,82 @@
+# pgvector-ann/backend/utils/row_counts.py
+# Row counts of searchable tables, maintained out of band so searches never run COUNT(*).
+#
+# Ingest scripts call refresh_row_counts for the tables they changed (one grouped COUNT per table, after the
+# load) before bumping the ingest generation. The backend reloads the counts into RowCounts whenever the
+# generation changes, and falls back to the planner's reltuples estimate for tables without recorded counts.
+import logging
+
+logger = logging.getLogger(__name__)
+
+CREATE_ROW_COUNTS_TABLE = """
+CREATE TABLE IF NOT EXISTS table_row_counts (
+    table_name TEXT NOT NULL,
+    business_category TEXT NOT NULL,
+    row_count BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (table_name, business_category)
+);
+"""
+
+SELECT_ROW_COUNTS = "SELECT business_category, row_count FROM table_row_counts WHERE table_name = %s;"
+
+# Sum of reltuples over the table and its partitions; -1 (never analyzed) counts as 0
+ESTIMATE_ROW_COUNT = """
+SELECT COALESCE(SUM(GREATEST(c.reltuples, 0)), 0)::bigint FROM pg_class c
+WHERE c.oid = to_regclass(%(table)s)
+   OR c.oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = to_regclass(%(table)s));
+"""
+
+def refresh_row_counts(conn, table_names):
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_ROW_COUNTS_TABLE)
+        for table_name in table_names:
+            cursor.execute("DELETE FROM table_row_counts WHERE table_name = %s;", (table_name,))
+            cursor.execute("SELECT to_regclass(%s);", (table_name,))
+            if cursor.fetchone()[0] is None:
+                continue
+            cursor.execute(f"SELECT business_category, COUNT(*) FROM {table_name} GROUP BY business_category;")
+            counts = cursor.fetchall()
+            for business_category, row_count in counts:
+                cursor.execute("""
+                INSERT INTO table_row_counts (table_name, business_category, row_count, updated_at)
+                VALUES (%s, %s, %s, now());
+                """, (table_name, business_category or '', row_count))
+            logger.info(f"Recorded {sum(count for _, count in counts)} rows in {len(counts)} categories of {table_name}")
+    conn.commit()
+
+class RowCounts:
+    """Per-category row counts of one table, or only an estimated total when none were recorded."""
+
+    def __init__(self, counts=None, estimated_total=None):
+        self.counts = counts or {}
+        self.estimated_total = estimated_total
+
+    def get(self, categories=None):
+        if not self.counts:
+            return int(self.estimated_total or 0)
+        if categories:
+            return sum(self.counts.get(category, 0) for category in categories)
+        return sum(self.counts.values())
+
+    def snapshot(self):
+        return {'counts': self.counts, 'estimated_total': self.estimated_total}
+
+def get_row_counts(cursor, table_name):
+    # Sync variant for the batch scripts (psycopg or psycopg2 cursors)
+    cursor.execute(CREATE_ROW_COUNTS_TABLE)
+    cursor.execute(SELECT_ROW_COUNTS, (table_name,))
+    counts = dict(cursor.fetchall())
+    if counts:
+        return RowCounts(counts)
+    cursor.execute(ESTIMATE_ROW_COUNT, {'table': table_name})
+    return RowCounts(estimated_total=cursor.fetchone()[0])
+
+async def async_get_row_counts(conn, table_name):
+    await conn.execute(CREATE_ROW_COUNTS_TABLE)
+    cursor = await conn.execute(SELECT_ROW_COUNTS, (table_name,))
+    counts = dict(await cursor.fetchall())
+    if counts:
+        return RowCounts(counts)
+    cursor = await conn.execute(ESTIMATE_ROW_COUNT, {'table': table_name})
+    return RowCounts(estimated_total=(await cursor.fetchone())[0])
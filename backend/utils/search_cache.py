@@ -0,0 +1,129 @@
+# pgvector-ann/backend/utils/search_cache.py
+# Search-result cache for the backend, versioned by an ingest generation counter.
+#
+# Every ingest script that changes searchable rows calls bump_ingest_generation, which increments the single row
+# of ingest_generation and sends NOTIFY ingest_generation in the same transaction. The backend LISTENs on a
+# dedicated connection and drops the whole cache when the generation moves. Cache entries also carry the
+# generation they were computed under, so a result that was still in flight during a bump is not stored.
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+import numpy as np
+import psycopg
+
+logger = logging.getLogger(__name__)
+
+INGEST_GENERATION_CHANNEL = "ingest_generation"
+
+CREATE_GENERATION_TABLE = """
+CREATE TABLE IF NOT EXISTS ingest_generation (
+    id BOOLEAN PRIMARY KEY DEFAULT true CHECK (id),
+    generation BIGINT NOT NULL,
+    source TEXT,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+def bump_ingest_generation(conn, source):
+    # Called by ingest scripts after their data is committed; returns the new generation
+    with conn.cursor() as cursor:
+        cursor.execute(CREATE_GENERATION_TABLE)
+        cursor.execute("""
+        INSERT INTO ingest_generation (id, generation, source, updated_at) VALUES (true, 1, %s, now())
+        ON CONFLICT (id) DO UPDATE SET generation = ingest_generation.generation + 1,
+            source = EXCLUDED.source, updated_at = now()
+        RETURNING generation;
+        """, (source,))
+        generation = cursor.fetchone()[0]
+        cursor.execute("SELECT pg_notify(%s, %s);", (INGEST_GENERATION_CHANNEL, str(generation)))
+    conn.commit()
+    logger.info(f"Bumped ingest generation to {generation} ({source})")
+    return generation
+
+async def async_get_ingest_generation(conn):
+    await conn.execute(CREATE_GENERATION_TABLE)
+    cursor = await conn.execute("SELECT generation FROM ingest_generation;")
+    row = await cursor.fetchone()
+    return row[0] if row else 0
+
+def get_search_cache_key(query_vector, top_n, table_name, categories, index_type, search_params):
+    # search_params: ef_search / probes / oversampling settings that change the result of an ANN scan
+    vector_hash = hashlib.sha256(np.asarray(query_vector, dtype=np.float32).tobytes()).hexdigest()
+    return (vector_hash, int(top_n), table_name, tuple(sorted(categories)) if categories else None, index_type, search_params)
+
+class SearchResultCache:
+    """LRU of search results for the current ingest generation, cleared whenever the generation changes."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generation = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def set_generation(self, generation):
+        if generation != self.generation:
+            if self.entries:
+                self.invalidations += 1
+            logger.info(f"Search cache generation {self.generation} -> {generation}, dropping {len(self.entries)} entries")
+            self.entries.clear()
+            self.generation = generation
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value, generation):
+        # generation is the one read before the query ran; a bump in between makes the result stale
+        if self.max_entries <= 0 or generation is None or generation != self.generation:
+            return
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def snapshot(self):
+        lookups = self.hits + self.misses
+        return {
+            'generation': self.generation,
+            'entries': len(self.entries),
+            'max_entries': self.max_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+            'invalidations': self.invalidations
+        }
+
+async def listen_for_generations(cache, connection_kwargs, on_generation=None, retry_interval=5.0):
+    # Runs for the application's lifetime. The generation is re-read after every (re)connect, so bumps sent
+    # while the listener was down are not missed; until then the cache keeps serving its last generation.
+    # on_generation(generation) is awaited after every read or notification, for other state that has to follow
+    # ingest (row counts). It must not use the listener's connection: conn.notifies() holds the connection lock
+    # while it waits, so a query on it from inside the loop would never get the lock.
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(autocommit=True, **connection_kwargs) as conn:
+                await conn.execute(f"LISTEN {INGEST_GENERATION_CHANNEL};")
+                generation = await async_get_ingest_generation(conn)
+                if on_generation is not None:
+                    await on_generation(generation)
+                cache.set_generation(generation)
+                async for notify in conn.notifies():
+                    generation = int(notify.payload)
+                    if on_generation is not None:
+                        await on_generation(generation)
+                    cache.set_generation(generation)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Ingest generation listener error: {e}")
+            # Without notifications the cache could go stale, so stop serving from it until reconnected
+            cache.set_generation(None)
+        await asyncio.sleep(retry_interval)
@@ -0,0 +1,150 @@
+# pgvector-ann/backend/utils/table_generations.py
+# Blue/green generations of chunk tables (ENABLE_BLUE_GREEN=true).
+#
+# Ingest loads and indexes <base>_shadow while searches keep reading <base>, which is a view over the current
+# generation <base>_g<N>. swap_generation renames the shadow (with its partitions and indexes) to the next
+# generation and repoints the view in one transaction. The previous generation is kept for rollback_generation;
+# older ones are dropped.
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHADOW_SUFFIX = "_shadow"
+# get_index_name puts the index type in front of the table name
+INDEX_NAME_PREFIXES = ("", "hnsw_bq_", "hnsw_", "ivfflat_")
+
+def ensure_generations_table(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS table_generations (
+        base_name TEXT PRIMARY KEY,
+        current_table TEXT NOT NULL,
+        previous_table TEXT,
+        generation INTEGER NOT NULL,
+        swapped_at TIMESTAMPTZ NOT NULL DEFAULT now()
+    );
+    """)
+
+def get_shadow_name(base_name):
+    return f"{base_name}{SHADOW_SUFFIX}"
+
+def get_relkind(cursor, name):
+    cursor.execute("""
+    SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public' AND c.relname = %s;
+    """, (name,))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def check_not_generation_view(cursor, table_name):
+    # After the first swap <base> is a view over its current generation. Ingest without blue/green would
+    # run its DDL (CREATE TABLE IF NOT EXISTS, unique key, index) against the view, so it is refused
+    if get_relkind(cursor, table_name) == "v":
+        raise ValueError(f"{table_name} is a blue/green view over its current generation; ingest into it with "
+                         f"ENABLE_BLUE_GREEN=true")
+
+def drop_shadow(cursor, base_name):
+    # Leftovers of an interrupted run; partitions of a shadow parent go with it
+    cursor.execute(f"DROP TABLE IF EXISTS {get_shadow_name(base_name)} CASCADE;")
+
+def get_tables_with_partitions(cursor, table_name):
+    cursor.execute("""
+    SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+    WHERE i.inhparent = %s::regclass;
+    """, (table_name,))
+    return [table_name] + [row[0] for row in cursor.fetchall()]
+
+def get_table_indexes(cursor, table_name):
+    cursor.execute("SELECT indexname FROM pg_indexes WHERE schemaname = 'public' AND tablename = %s;", (table_name,))
+    return [row[0] for row in cursor.fetchall()]
+
+def replace_name_prefix(name, old_prefix, new_prefix):
+    # Only a leading old_prefix (after the index type for vector indexes) is replaced; None if there is none
+    for head in INDEX_NAME_PREFIXES:
+        if name.startswith(head + old_prefix):
+            return head + new_prefix + name[len(head) + len(old_prefix):]
+    return None
+
+def rename_relations(cursor, old_prefix, new_prefix):
+    # Rename a table, its partitions and all of their indexes by replacing the old_prefix their names start
+    # with, so the next shadow can reuse the original index names. Other names are left as they are.
+    for table_name in get_tables_with_partitions(cursor, old_prefix):
+        for index_name in get_table_indexes(cursor, table_name):
+            new_index_name = replace_name_prefix(index_name, old_prefix, new_prefix)
+            if new_index_name:
+                cursor.execute(f"ALTER INDEX {index_name} RENAME TO {new_index_name};")
+        new_table_name = replace_name_prefix(table_name, old_prefix, new_prefix)
+        if new_table_name:
+            cursor.execute(f"ALTER TABLE {table_name} RENAME TO {new_table_name};")
+
+def prewarm_table(conn, table_name):
+    # Load the shadow's vector indexes into shared buffers before it goes live. pg_prewarm is a contrib
+    # extension; if it is not available the swap still happens, just cold.
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_prewarm;")
+            blocks = 0
+            for partition in get_tables_with_partitions(cursor, table_name):
+                for index_name in get_table_indexes(cursor, partition):
+                    if index_name.endswith("_chunk_vector_idx"):
+                        cursor.execute("SELECT pg_prewarm(%s::regclass);", (index_name,))
+                        blocks += cursor.fetchone()[0]
+        conn.commit()
+        logger.info(f"Prewarmed {blocks} index blocks of {table_name}")
+    except Exception as e:
+        conn.rollback()
+        logger.warning(f"Could not prewarm {table_name}: {e}")
+
+def swap_generation(conn, base_name):
+    # Promote <base>_shadow to the next generation and point the <base> view at it. Returns the new table name.
+    shadow_name = get_shadow_name(base_name)
+    with conn.cursor() as cursor:
+        ensure_generations_table(cursor)
+        cursor.execute("SELECT current_table, previous_table, generation FROM table_generations "
+                       "WHERE base_name = %s FOR UPDATE;", (base_name,))
+        row = cursor.fetchone()
+        current_table, previous_table, generation = row if row else (None, None, 0)
+        new_table = f"{base_name}_g{generation + 1}"
+
+        # Readers block on the view for the duration of this transaction only
+        if get_relkind(cursor, base_name) in ("r", "p"):
+            # First swap: the table built before blue/green becomes generation 0
+            current_table = f"{base_name}_g0"
+            rename_relations(cursor, base_name, current_table)
+        rename_relations(cursor, shadow_name, new_table)
+        cursor.execute(f"DROP VIEW IF EXISTS {base_name};")
+        cursor.execute(f"CREATE VIEW {base_name} AS SELECT * FROM {new_table};")
+        cursor.execute("""
+        INSERT INTO table_generations (base_name, current_table, previous_table, generation, swapped_at)
+        VALUES (%s, %s, %s, %s, now())
+        ON CONFLICT (base_name) DO UPDATE SET current_table = EXCLUDED.current_table,
+            previous_table = EXCLUDED.previous_table, generation = EXCLUDED.generation, swapped_at = now();
+        """, (base_name, new_table, current_table, generation + 1))
+    conn.commit()
+    logger.info(f"Swapped {base_name} to {new_table} (previous: {current_table})")
+
+    # Only the current and the previous generation are kept
+    if previous_table:
+        with conn.cursor() as cursor:
+            cursor.execute(f"DROP TABLE IF EXISTS {previous_table} CASCADE;")
+        conn.commit()
+        logger.info(f"Dropped generation {previous_table}")
+    return new_table
+
+def rollback_generation(conn, base_name):
+    # Point the <base> view back at the previous generation; the rolled-back one becomes the previous
+    with conn.cursor() as cursor:
+        ensure_generations_table(cursor)
+        cursor.execute("SELECT current_table, previous_table FROM table_generations WHERE base_name = %s FOR UPDATE;",
+                       (base_name,))
+        row = cursor.fetchone()
+        if row is None or row[1] is None:
+            conn.rollback()
+            raise ValueError(f"No previous generation recorded for {base_name}")
+        current_table, previous_table = row
+        cursor.execute(f"DROP VIEW IF EXISTS {base_name};")
+        cursor.execute(f"CREATE VIEW {base_name} AS SELECT * FROM {previous_table};")
+        cursor.execute("UPDATE table_generations SET current_table = %s, previous_table = %s, swapped_at = now() "
+                       "WHERE base_name = %s;", (previous_table, current_table, base_name))
+    conn.commit()
+    logger.info(f"Rolled {base_name} back from {current_table} to {previous_table}")
+    return previous_table
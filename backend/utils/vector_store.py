@@ -0,0 +1,162 @@
+# pgvector-ann/backend/utils/vector_store.py
+# Intermediate chunk tables written by the vectorizer and read by csv_to_pgvector.
+#
+# csv: one CSV with chunk_vector stored as list text (the original format)
+# npy: the same CSV without chunk_vector, plus a <name>.npy sidecar holding an (rows, dim) float32/float16
+#      matrix in row order. The loader memory-maps the sidecar instead of parsing text.
+import base64
+import json
+import logging
+import os
+import struct
+import numpy as np
+import pandas as pd
+from config import VECTOR_STORAGE_FORMAT, VECTOR_STORAGE_DTYPE
+
+logger = logging.getLogger(__name__)
+
+NPY_HEADER_SIZE = 128
+
+def get_vector_path(csv_path):
+    return f"{os.path.splitext(csv_path)[0]}.npy"
+
+def has_vector_sidecar(csv_path):
+    return os.path.exists(get_vector_path(csv_path))
+
+def npy_header(rows, dim, dtype):
+    # Fixed-size .npy v1.0 header, so the row count can be patched in after streaming the data
+    header = "{'descr': %r, 'fortran_order': False, 'shape': (%d, %d), }" % (
+        np.lib.format.dtype_to_descr(np.dtype(dtype)), rows, dim)
+    header = header.ljust(NPY_HEADER_SIZE - 10 - 1) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+def decode_embedding(embedding):
+    # Embeddings requested with encoding_format="base64" arrive as little-endian float32 bytes
+    if isinstance(embedding, str):
+        return np.frombuffer(base64.b64decode(embedding), dtype=np.float32)
+    return np.asarray(embedding, dtype=np.float32)
+
+class EmbeddingMatrix:
+    """Float32 embedding matrix preallocated for the expected row count and grown by doubling when exceeded."""
+
+    def __init__(self, rows=0):
+        self.expected_rows = rows
+        self.data = None
+        self.rows = 0
+
+    def set(self, i, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.data is None:
+            self.data = np.zeros((max(self.expected_rows, i + 1), len(vector)), dtype=np.float32)
+        elif i >= len(self.data):
+            grown = np.zeros((max(len(self.data) * 2, i + 1), self.data.shape[1]), dtype=np.float32)
+            grown[:len(self.data)] = self.data
+            self.data = grown
+        self.data[i] = vector
+        self.rows = max(self.rows, i + 1)
+
+    def append(self, vector):
+        self.set(self.rows, vector)
+
+    @property
+    def array(self):
+        if self.data is None:
+            return np.zeros((0, 0), dtype=np.float32)
+        return self.data[:max(self.rows, self.expected_rows)]
+
+def vector_to_text(vector):
+    if isinstance(vector, np.ndarray):
+        vector = vector.tolist()
+    return json.dumps(vector)
+
+class VectorTableWriter:
+    """Writes a chunk table incrementally to <path>.tmp (and its sidecar) and moves it into place on close()."""
+
+    def __init__(self, path, storage_format=VECTOR_STORAGE_FORMAT, dtype=VECTOR_STORAGE_DTYPE):
+        self.path = path
+        self.storage_format = storage_format
+        self.dtype = np.dtype(dtype)
+        self.tmp_path = f"{path}.tmp"
+        self.tmp_vector_path = f"{get_vector_path(path)}.tmp"
+        self.vector_file = None
+        self.rows = 0
+        self.dim = None
+
+    def write(self, df, vectors=None):
+        # vectors: optional (len(df), dim) matrix used instead of a chunk_vector column
+        if df.empty:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        header = self.rows == 0
+        if self.storage_format == "npy":
+            vectors = np.asarray(vectors if vectors is not None else list(df['chunk_vector']), dtype=self.dtype)
+            if self.vector_file is None:
+                self.dim = vectors.shape[1]
+                self.vector_file = open(self.tmp_vector_path, 'wb')
+                self.vector_file.write(npy_header(0, self.dim, self.dtype))
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension changed from {self.dim} to {vectors.shape[1]} in {self.path}")
+            self.vector_file.write(np.ascontiguousarray(vectors).tobytes())
+            df = df.drop(columns=['chunk_vector'], errors='ignore')
+        else:
+            vectors = list(vectors) if vectors is not None else df['chunk_vector']
+            df = df.assign(chunk_vector=[vector_to_text(vector) for vector in vectors])
+        df.to_csv(self.tmp_path, mode='w' if header else 'a', header=header, index=False)
+        self.rows += len(df)
+
+    def close(self):
+        # Returns the number of rows written; nothing is created if no rows were written
+        if self.vector_file is not None:
+            self.vector_file.seek(0)
+            self.vector_file.write(npy_header(self.rows, self.dim, self.dtype))
+            self.vector_file.close()
+            self.vector_file = None
+        if self.rows == 0:
+            return 0
+        os.replace(self.tmp_path, self.path)
+        vector_path = get_vector_path(self.path)
+        if self.storage_format == "npy":
+            os.replace(self.tmp_vector_path, vector_path)
+        elif os.path.exists(vector_path):
+            os.remove(vector_path)  # a stale sidecar would shadow the CSV vectors
+        return self.rows
+
+    def abort(self):
+        if self.vector_file is not None:
+            self.vector_file.close()
+            self.vector_file = None
+        for path in (self.tmp_path, self.tmp_vector_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+def write_vector_table(df, path, vectors=None):
+    writer = VectorTableWriter(path)
+    try:
+        writer.write(df, vectors)
+        return writer.close()
+    except Exception:
+        writer.abort()
+        raise
+
+def remove_vector_table(path):
+    for file_path in (path, get_vector_path(path)):
+        if os.path.exists(file_path):
+            os.remove(file_path)
+
+def iter_vector_table(path, chunksize):
+    """Yield (metadata DataFrame, vectors) chunks of a chunk table in row order.
+
+    vectors is a slice of the memory-mapped sidecar for npy tables, or a list of parsed lists for CSV tables.
+    """
+    if has_vector_sidecar(path):
+        vectors = np.load(get_vector_path(path), mmap_mode='r')
+        offset = 0
+        for meta in pd.read_csv(path, chunksize=chunksize):
+            yield meta, vectors[offset:offset + len(meta)]
+            offset += len(meta)
+        if offset != len(vectors):
+            logger.warning(f"{path} has {offset} rows but its vector sidecar has {len(vectors)}")
+    else:
+        for chunk in pd.read_csv(path, chunksize=chunksize):
+            vectors = [json.loads(vector) if isinstance(vector, str) else vector for vector in chunk['chunk_vector']]
+            yield chunk.drop(columns=['chunk_vector']), vectors